@@ -0,0 +1,105 @@
+"""
+Benchmark: product search over a synthetic catalog of 100k products.
+
+Compares the previous `name ILIKE '%q%'` search (sequential scan) with the
+ranked full-text + trigram search in routers/products/helpers.py, before and
+after the search indexes exist.
+
+Everything runs in one transaction against a temporary `products` table that
+shadows the real one, and is rolled back at the end; the real catalog is not
+touched. Needs DATABASE_URL (a migrated database, for the table layout).
+
+Run from the backend directory:
+    python -m benchmarks.bench_product_search [rows]
+"""
+import asyncio
+import random
+import statistics
+import sys
+import time
+import uuid
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import async_engine
+from models import Product
+from routers.products.helpers import search_product_page
+
+ADJECTIVES = ["fresh", "organic", "red", "green", "premium", "local", "dried", "whole", "baby", "farm"]
+ITEMS = [
+    "onion", "tomato", "potato", "garlic", "ginger", "chilli", "coriander", "paneer", "cauliflower",
+    "cabbage", "spinach", "carrot", "lemon", "mint", "okra", "brinjal", "capsicum", "peas", "rice", "atta"
+]
+PACKS = ["250g", "500g", "1kg", "5kg", "10kg", "dozen", "bunch", "crate"]
+QUERIES = ["onion", "oni", "red tom", "panner", "cauliflower 5kg", "organic gin"]
+RUNS = 15
+
+
+def synthetic_products(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    supplier_ids = [uuid.uuid4() for _ in range(500)]
+    for index in range(count):
+        name = f"{rng.choice(ADJECTIVES).title()} {rng.choice(ITEMS).title()} {rng.choice(PACKS)} #{index}"
+        description = f"{rng.choice(ADJECTIVES)} {rng.choice(ITEMS)} sourced {rng.choice(['daily', 'weekly', 'locally'])}"
+        yield (uuid.uuid4(), rng.choice(supplier_ids), name, description, "unit", 10 + rng.random() * 90, None, True)
+
+
+async def timed(label: str, run) -> None:
+    durations = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        await run()
+        durations.append((time.perf_counter() - started) * 1000)
+    print(f"  {label:<40} median {statistics.median(durations):8.2f} ms   p95 {sorted(durations)[int(RUNS * 0.95) - 1]:8.2f} ms")
+
+
+async def run_queries(db: AsyncSession, heading: str) -> None:
+    print(heading)
+    for query_str in QUERIES:
+        async def legacy():
+            await db.execute(select(Product).where(Product.name.ilike(f"%{query_str}%"), Product.is_available == True))
+
+        async def ranked():
+            await search_product_page(db, query_str, None, 50)
+
+        await timed(f"ilike      {query_str!r}", legacy)
+        await timed(f"ranked     {query_str!r}", ranked)
+
+
+async def main(rows: int) -> None:
+    if async_engine is None:
+        raise SystemExit("DATABASE_URL is not configured")
+
+    async with async_engine.connect() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        # Shadows public.products for this session: pg_temp comes first in the search path
+        await conn.execute(text("CREATE TEMP TABLE products (LIKE public.products INCLUDING DEFAULTS)"))
+
+        raw_connection = await conn.get_raw_connection()
+        started = time.perf_counter()
+        await raw_connection.driver_connection.copy_records_to_table(
+            "products",
+            records=list(synthetic_products(rows)),
+            columns=["id", "supplier_id", "name", "description", "unit", "base_price", "img_emoji", "is_available"]
+        )
+        await conn.execute(text("ANALYZE products"))
+        print(f"Loaded {rows} synthetic products in {time.perf_counter() - started:.1f}s\n")
+
+        db = AsyncSession(bind=conn)
+        await run_queries(db, "Without search indexes:")
+
+        started = time.perf_counter()
+        for index in Product.__table__.indexes:
+            await conn.run_sync(index.create)
+        await conn.execute(text("ANALYZE products"))
+        print(f"\nBuilt indexes in {time.perf_counter() - started:.1f}s\n")
+
+        await run_queries(db, "With search indexes:")
+
+        await db.close()
+        await conn.rollback()  # Drops the temporary table and anything else created above
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
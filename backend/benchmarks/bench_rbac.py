@@ -0,0 +1,64 @@
+"""
+Microbenchmark: per-request RBAC authorization cost.
+
+Compares the previous check (normalize_path on the raw URL, then nested dict
+and list lookups) with the compiled bitmask table keyed by the route template.
+
+Run from the backend directory:
+    python -m benchmarks.bench_rbac
+"""
+import timeit
+
+from dependencies.rbac import (
+    RESOURCES_FOR_ROLES, normalize_path, resolve_resource, permission_mask, ACTION_BITS, METHOD_ACTIONS
+)
+
+# (role, raw URL, route template, method)
+REQUESTS = [
+    ('vendor', '/products/8f14e45f-ceea-467f-a0e6-0b7f8b5d1c2a', '/products/{product_id}', 'GET'),
+    ('vendor', '/cart/items/3c59dc04-8f1e-4e34-9d0c-5b7c8f1e2a3b', '/cart/items/{item_id}', 'PUT'),
+    ('supplier', '/products/', '/products/', 'POST'),
+    ('admin', '/admin/users/42', '/admin/users/{user_id}', 'GET'),
+    ('agent', '/routes/me/route-progress', '/routes/me/route-progress', 'GET'),
+    ('user', '/users/me', '/users/me', 'PATCH'),
+]
+
+
+def legacy_check(role: str, url: str, method: str) -> bool:
+    """The per-request work require_permission used to do."""
+    resource_name = normalize_path(url)
+    action = {'GET': 'read', 'POST': 'write', 'PUT': 'write', 'PATCH': 'write', 'DELETE': 'delete'}.get(method.upper(), 'read')
+    if role not in RESOURCES_FOR_ROLES:
+        return False
+    user_permissions = RESOURCES_FOR_ROLES[role]
+    if resource_name in user_permissions:
+        return action in user_permissions[resource_name]
+    parent = resource_name.split('/')[0] if '/' in resource_name else resource_name
+    if parent in user_permissions:
+        return action in user_permissions[parent]
+    return False
+
+
+def compiled_check(role: str, template: str, method: str) -> bool:
+    """The per-request work require_permission does now."""
+    return bool(permission_mask(role, resolve_resource(template)) & ACTION_BITS[METHOD_ACTIONS.get(method, 'read')])
+
+
+def main(number: int = 200_000):
+    for role, url, template, method in REQUESTS:
+        assert legacy_check(role, url, method) == compiled_check(role, template, method), (role, url, method)
+
+    legacy = timeit.timeit(
+        lambda: [legacy_check(role, url, method) for role, url, _, method in REQUESTS], number=number
+    )
+    compiled = timeit.timeit(
+        lambda: [compiled_check(role, template, method) for role, _, template, method in REQUESTS], number=number
+    )
+
+    checks = number * len(REQUESTS)
+    print(f"legacy:   {legacy / checks * 1e9:8.1f} ns/check")
+    print(f"compiled: {compiled / checks * 1e9:8.1f} ns/check  ({legacy / compiled:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -68,6 +68,11 @@ else:
     AsyncSessionLocal = None
 
 async def get_db():
+    """
+    Request-scoped session. The session is lazy: a pooled connection is only
+    checked out on the first query and goes back to the pool on commit,
+    rollback or close, so endpoints that never touch it cost no connection.
+    """
     if AsyncSessionLocal is None:
         raise Exception("Database not configured")
     async with AsyncSessionLocal() as session:
@@ -1,46 +1,108 @@
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from config import JWT_SECRET_KEY, get_db
+from config import JWT_SECRET_KEY, AsyncSessionLocal
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 from sqlalchemy import select
+from utils.cache import TTLCache
+import hashlib
 import jwt
 import os
+import time
 import logging
-from typing import Dict, Any, List, Callable
+from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 security = HTTPBearer()
 
-async def get_current_user(
-    request: Request,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-):
-    """Get current user from JWT token"""
+# Verified token payloads, keyed by sha256(token), kept until the token expires
+_token_cache = TTLCache(ttl=0, max_size=int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", "10000")))
+# Database role per user id. Role changes made in this process invalidate it;
+# other worker processes pick them up after the TTL.
+_role_cache = TTLCache(ttl=float(os.environ.get("AUTH_ROLE_CACHE_TTL_SECONDS", "60")))
+_NO_ROLE = "__none__"  # Cached marker for "profile has no role in the database"
+
+
+def invalidate_user_role(user_id) -> None:
+    """Forget the cached role of a user; call after changing their role."""
+    _role_cache.pop(str(user_id))
+
+
+def verify_token(token: str) -> Dict[str, Any]:
+    """Decode and verify a JWT, reusing the result for repeated tokens until they expire."""
+    key = hashlib.sha256(token.encode()).hexdigest()
+    payload = _token_cache.get(key)
+    if payload is not None:
+        return payload
+
+    payload = jwt.decode(
+        token,
+        JWT_SECRET_KEY,
+        algorithms=["HS256"],
+        options={"verify_signature": True, "verify_exp": True, "verify_aud": False}
+    )
+    exp = payload.get("exp")
+    if exp is not None:
+        _token_cache.set(key, payload, ttl=exp - time.time())
+    return payload
+
+
+async def _fetch_role(db: AsyncSession, user_id: str) -> Optional[str]:
+    from models import Profile, Role
+    result = await db.execute(
+        select(Role.name)
+        .select_from(Profile)
+        .join(Role, Profile.role_id == Role.id, isouter=True)
+        .where(Profile.id == user_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def get_user_role(user_id: str, jwt_role: str, db: Optional[AsyncSession] = None) -> str:
+    """
+    Current role from the database (cached), falling back to the role in the JWT.
+
+    Without a session, a short-lived one is opened only on a cache miss, so its
+    connection goes back to the pool before the endpoint itself runs.
+    """
+    cached = _role_cache.get(user_id)
+    if cached is not None:
+        return jwt_role if cached == _NO_ROLE else cached
+
     try:
-        token = credentials.credentials
-        logger.info(f"Received token: {token[:20]}...")  # Log first 20 chars for debugging
-        
-        # Get JWT secret from Supabase anon key
-        jwt_secret = JWT_SECRET_KEY
-        
-        # Decode the JWT token
-        payload = jwt.decode(
-            token, 
-            jwt_secret, 
-            algorithms=["HS256"],
-            options={"verify_signature": True, "verify_exp": True, "verify_aud": False}
-        )
-        
+        if db is not None:
+            role_name = await _fetch_role(db, user_id)
+        else:
+            async with AsyncSessionLocal() as session:
+                role_name = await _fetch_role(session, user_id)
+    except Exception as e:
+        logger.warning(f"Could not fetch role from database: {e}, using JWT role: {jwt_role}")
+        return jwt_role
+
+    _role_cache.set(user_id, role_name or _NO_ROLE)
+    if not role_name:
+        logger.debug(f"No role found in database, using JWT role: {jwt_role}")
+    return role_name or jwt_role
+
+
+async def authenticate_token(token: str, db: Optional[AsyncSession] = None) -> Dict[str, Any]:
+    """
+    Turn a bearer token into the current-user dict used across the app.
+
+    Shared by the HTTP dependency below and by endpoints that receive the
+    token some other way (e.g. a query parameter).
+
+    Raises:
+        HTTPException: 401 if the token is invalid or expired
+    """
+    try:
+        payload = verify_token(token)
+
         # Extract user information from payload
         user_id = payload.get("sub")
         email = payload.get("email")
         user_metadata = payload.get("user_metadata", {})
         jwt_role = user_metadata.get("role", "user")  # role from JWT as fallback
 
-        logger.info(f"Decoded user: {user_id}, email: {email}, JWT role: {jwt_role}")
-        
         if not user_id:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -49,40 +111,20 @@ async def get_current_user(
             )
 
         # Check database for current role (this ensures we get the most up-to-date role)
-        current_role = jwt_role  # fallback to JWT role
-        try:
-            from models import Profile, Role
-            result = await db.execute(
-                select(Profile, Role.name.label('role_name'))
-                .join(Role, Profile.role_id == Role.id, isouter=True)
-                .where(Profile.id == user_id)
-            )
-            profile_with_role = result.first()
-            
-            if profile_with_role and profile_with_role.role_name:
-                current_role = profile_with_role.role_name
-                logger.info(f"Updated role from database: {current_role}")
-            else:
-                logger.info(f"No role found in database, using JWT role: {jwt_role}")
-                
-        except Exception as e:
-            logger.warning(f"Could not fetch role from database: {e}, using JWT role: {jwt_role}")
+        current_role = await get_user_role(user_id, jwt_role, db)
+
+        logger.debug(f"User {user_id} authenticated with role: {current_role}")
 
         # Create a user-like object with the decoded information
-        current_user = {
+        return {
             "user_id": user_id,
-            "email": email, 
+            "email": email,
             "role": current_role,
             "payload": payload
         }
 
-        logger.info(f"User {user_id} authenticated with role: {current_role}")
-        
-        # Set current user in request state for RBAC
-        request.state.current_user = current_user
-        
-        return current_user
-        
+    except HTTPException:
+        raise
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -104,4 +146,19 @@ async def get_current_user(
         )
 
 
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Get current user from JWT token.
+
+    Deliberately does not depend on get_db: endpoints that only need the user
+    never check out a pooled connection.
+    """
+    current_user = await authenticate_token(credentials.credentials)
+
+    # Set current user in request state for RBAC
+    request.state.current_user = current_user
 
+    return current_user
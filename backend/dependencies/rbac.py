@@ -3,9 +3,13 @@ RBAC dependencies for FastAPI routes
 Role-based access control implemented as dependencies that run after authentication
 """
 from fastapi import Depends, HTTPException, status, Request
-from typing import Dict, Any
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Tuple
 import logging
 
+from dependencies.get_current_user import get_current_user
+
 logger = logging.getLogger(__name__)
 
 RESOURCES_FOR_ROLES = {
@@ -98,82 +102,95 @@ def normalize_path(path: str) -> str:
     
     return segments[0]
 
+# --- Compiled permission table ---
+# Actions are bits, so a permission check is one dict lookup and one AND.
+READ, WRITE, DELETE = 1, 2, 4
+
+ACTION_BITS = MappingProxyType({'read': READ, 'write': WRITE, 'delete': DELETE})
+METHOD_ACTIONS = MappingProxyType({
+    'GET': 'read',
+    'POST': 'write',
+    'PUT': 'write',
+    'PATCH': 'write',
+    'DELETE': 'delete',
+})
+
+
+def compile_permissions(resources_for_roles: Dict[str, Dict[str, list]]) -> Mapping[Tuple[str, str], int]:
+    """Flatten the role/resource/action lists into a frozen {(role, resource): bitmask} table"""
+    table = {}
+    for role, resources in resources_for_roles.items():
+        for resource_name, actions in resources.items():
+            mask = 0
+            for action in actions:
+                mask |= ACTION_BITS[action]
+            table[(role, resource_name)] = mask
+    return MappingProxyType(table)
+
+
+PERMISSION_TABLE = compile_permissions(RESOURCES_FOR_ROLES)
+
+
+def permission_mask(user_role: str, resource_name: str) -> int:
+    """Allowed actions of a role on a resource; sub-resources fall back to their parent"""
+    mask = PERMISSION_TABLE.get((user_role, resource_name))
+    if mask is None and '/' in resource_name:
+        mask = PERMISSION_TABLE.get((user_role, resource_name.split('/')[0]))
+    return mask or 0
+
+
+@lru_cache(maxsize=1024)
+def resolve_resource(path: str) -> str:
+    """normalize_path, memoized; called with route templates, so the set of inputs is small"""
+    return normalize_path(path)
+
+
 def translate_method_to_action(method: str) -> str:
     """Map HTTP methods to RBAC actions"""
-    method_permission_mapping = {
-        'GET': 'read',
-        'POST': 'write',
-        'PUT': 'write',
-        'PATCH': 'write',
-        'DELETE': 'delete',
-    }
-    return method_permission_mapping.get(method.upper(), 'read')
+    return METHOD_ACTIONS.get(method.upper(), 'read')
 
 def has_permission(user_role: str, resource_name: str, required_permission: str) -> bool:
     """Check if user role has permission for the resource and action"""
-    if user_role not in RESOURCES_FOR_ROLES:
-        return False
-    
-    user_permissions = RESOURCES_FOR_ROLES[user_role]
-    
-    if resource_name in user_permissions:
-        return required_permission in user_permissions[resource_name]
-    
-    parent_resource = resource_name.split('/')[0] if '/' in resource_name else resource_name
-    if parent_resource in user_permissions:
-        return required_permission in user_permissions[parent_resource]
-    
-    return False
+    return bool(permission_mask(user_role, resource_name) & ACTION_BITS.get(required_permission, 0))
 
 def require_permission(resource: str = None, permission: str = None):
     """
     Create an RBAC dependency that checks permissions
     
     Args:
-        resource: Specific resource name (auto-detected if not provided)
-        permission: Specific permission (auto-detected if not provided)
+        resource: Specific resource name (auto-detected from the route template if not provided)
+        permission: Specific permission (auto-detected from the HTTP method if not provided)
     """
-    async def check_rbac(request: Request):
+    # Resolved once here instead of on every request
+    required_bit = ACTION_BITS[permission] if permission else None
+
+    async def check_rbac(request: Request, current_user: dict = Depends(get_current_user)):
         """RBAC dependency function"""
-        # Import here to avoid circular imports
-        from dependencies.get_current_user import get_current_user
-        
-        try:
-            # First, get current user from request state or authenticate
-            current_user = getattr(request.state, 'current_user', None)
-            if not current_user:
-                # If not in request state, we need to authenticate first
-                # This happens when RBAC dependency is used without get_current_user dependency
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Authentication required"
-                )
-
-            user_role = current_user.get('role', 'user')  # Get role from current_user
-
-            resource_name = resource or normalize_path(str(request.url.path))
-            required_permission = permission or translate_method_to_action(request.method)
-            
-            logger.info(f"RBAC Check - User: {user_role}, Resource: {resource_name}, Permission: {required_permission}")
-
-            if not has_permission(user_role, resource_name, required_permission):
-                logger.warning(f"Access denied - User: {user_role}, Resource: {resource_name}, Permission: {required_permission}")
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Access denied. {user_role.title()} role does not have {required_permission} permission for {resource_name}"
-                )
-            
-            logger.info(f"Access granted - User: {user_role}, Resource: {resource_name}, Permission: {required_permission}")
-            return True
-            
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"RBAC dependency error: {str(e)}")
+        user_role = current_user.get('role', 'user')
+
+        if resource:
+            resource_name = resource
+        else:
+            # The matched route template ('/products/{product_id}') rather than the raw URL,
+            # so the resolution is cached per route
+            route = request.scope.get('route')
+            resource_name = resolve_resource(getattr(route, 'path', None) or request.url.path)
+
+        if required_bit is not None:
+            bit, required_permission = required_bit, permission
+        else:
+            required_permission = translate_method_to_action(request.method)
+            bit = ACTION_BITS[required_permission]
+
+        if not permission_mask(user_role, resource_name) & bit:
+            logger.warning(f"Access denied - User: {user_role}, Resource: {resource_name}, Permission: {required_permission}")
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Authorization check failed"
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Access denied. {user_role.title()} role does not have {required_permission} permission for {resource_name}"
             )
+
+        logger.debug(f"Access granted - User: {user_role}, Resource: {resource_name}, Permission: {required_permission}")
+        return True
     
     return check_rbac
 
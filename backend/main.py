@@ -1,7 +1,9 @@
-from fastapi import FastAPI, Request, HTTPException
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
-import pytz
+from fastapi.responses import PlainTextResponse
 from routers.auth.auth import auth_router
 from routers.users import users_router
 from routers.admin.admin import router as admin_router
@@ -11,14 +13,53 @@ from routers.wallet.wallet import wallet_router
 from routers.applications.applications import applications_router
 from routers.orders.orders import orders_router
 from routers.agents_routes.routes import agents_routes_router
+from utils.outbox_worker import run_outbox_worker
+from routers.orders.finalization import start_route_pool, stop_route_pool
+from utils.db_metrics import DbTimingMiddleware, install_pool_metrics
+from utils.ordering_window import OrderingWindowGate
+from utils.metrics import MetricsMiddleware, install_sql_metrics, render_metrics
+from dependencies.security import verify_internal_secret
+from config import AsyncSessionLocal, async_engine
+
+# Standalone workers (python -m utils.outbox_worker) can take over by setting this to false
+OUTBOX_WORKER_ENABLED = os.environ.get("OUTBOX_WORKER_ENABLED", "true").lower() == "true"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One process pool for route sequencing, reused by every finalization run
+    start_route_pool()
+
+    # Notifications leave through the outbox worker; let its current batch finish before shutdown
+    outbox_stop = asyncio.Event()
+    outbox_task = None
+    if OUTBOX_WORKER_ENABLED and AsyncSessionLocal is not None:
+        outbox_task = asyncio.create_task(run_outbox_worker(outbox_stop))
+
+    yield
+
+    outbox_stop.set()
+    if outbox_task is not None:
+        await outbox_task
+    stop_route_pool()
 
 
 app = FastAPI(
     title="Vendor Collective", # You can update the title
     description="A digital platform for the street food vendor cooperative in your locality.", 
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Per-request connection hold time, reported in the Server-Timing header
+if async_engine is not None:
+    install_pool_metrics(async_engine)
+    install_sql_metrics(async_engine)
+app.add_middleware(DbTimingMiddleware)
+
+# Cart and product changes only inside the daily ordering window (ORDERING_WINDOW_* settings)
+app.add_middleware(OrderingWindowGate)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -26,40 +67,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Server-Timing"],
 )
 
-@app.middleware("http")
-async def time_window_middleware(request: Request, call_next):
-    """
-    This middleware checks if an ordering-related request is within the
-    6:00 PM to 11:30 PM IST window.
-    """
-    # Define which paths are restricted by time
-    restricted_paths = ["/cart/items", "/products"]
-
-    is_restricted = any(request.url.path.startswith(path) for path in restricted_paths)
-    
-    # Allow users to BROWSE products anytime, but not create/update them
-    if request.method == "GET" and request.url.path.startswith("/products"):
-        is_restricted = False
+# Outermost, so latency includes every other middleware; scraped from /metrics
+app.add_middleware(MetricsMiddleware)
 
-    if is_restricted:
-        ist = pytz.timezone('Asia/Kolkata')
-        now_ist = datetime.now(ist)
-        current_hour = now_ist.hour
-        current_minute = now_ist.minute
-        
-        # Check if the time is between 6:00 PM (18:00) and 11:30 PM (23:30)
-        is_open = (18 <= current_hour < 23) or (current_hour == 23 and current_minute < 30)
-        
-        if not is_open:
-            raise HTTPException(
-                status_code=403, 
-                detail="The ordering window is currently closed. It is open from 6:00 PM to 11:30 PM IST."
-            )
 
-    response = await call_next(request)
-    return response
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(verify_internal_secret)])
+async def metrics():
+    """Prometheus scrape endpoint (send the x-internal-secret header)."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 app.include_router(auth_router)
 app.include_router(users_router)
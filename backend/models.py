@@ -1,8 +1,8 @@
 # models.py
-from sqlalchemy import Column, String, DateTime, Text, Boolean, ForeignKey, Integer, Numeric
+from sqlalchemy import Column, String, DateTime, Text, Boolean, ForeignKey, Integer, Numeric, UniqueConstraint, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from geoalchemy2 import Geography
 from config import Base
 import uuid
@@ -23,7 +23,7 @@ class Profile(Base):
     phone = Column(String, nullable=True)
     avatar_url = Column(String, nullable=True)
     location = Column(Geography(geometry_type='POINT', srid=4326), nullable=True)
-    wallet_balance = Column(Numeric(10, 2), default=0.0, nullable=True)  # Wallet balance for payments
+    wallet_balance = Column(Numeric(10, 2), default=0.0, nullable=True)  # Legacy; balances now live in wallet_balances
     is_active = Column(Boolean, default=True, nullable=False)
     is_approved = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -37,6 +37,16 @@ class Profile(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        Index("ix_products_name_id", "name", "id"),  # Keyset pagination of product listings
+        # Product search (see routers/products/helpers.py): substring/typo matching and full-text prefix matching
+        Index("ix_products_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index(
+            "ix_products_search_vector",
+            text("to_tsvector('simple'::regconfig, name || ' ' || coalesce(description, ''))"),
+            postgresql_using="gin"
+        ),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     supplier_id = Column(UUID(as_uuid=True), ForeignKey("profiles.id"), nullable=False)
@@ -67,6 +77,13 @@ class Deal(Base):
 
 class CartItem(Base):
     __tablename__ = "cart_items"
+    __table_args__ = (
+        # One open line per vendor and product; add-to-cart upserts against it
+        Index(
+            "uq_cart_items_vendor_product_open", "vendor_id", "product_id",
+            unique=True, postgresql_where=text("is_finalized = false")
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     vendor_id = Column(UUID(as_uuid=True), ForeignKey("profiles.id"), nullable=False)
@@ -75,11 +92,31 @@ class CartItem(Base):
     is_finalized = Column(Boolean, default=False)
     final_price = Column(Numeric(10, 2), nullable=True)
     added_at = Column(DateTime(timezone=True), server_default=func.now())
-    finalized_at = Column(DateTime(timezone=True), nullable=True)
+    finalized_at = Column(DateTime(timezone=True), nullable=True, index=True)
 
     vendor = relationship("Profile", foreign_keys=[vendor_id])
     product = relationship("Product")
 
+
+class ProductDemand(Base):
+    __tablename__ = "product_demand"
+
+    # Running total of non-finalized cart_items.quantity per product, adjusted by delta
+    # in the same transaction as every cart mutation (routers/cart/helpers.py) and finalization
+    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class CartSummary(Base):
+    __tablename__ = "cart_summaries"
+
+    # Per-vendor totals of the open cart, rewritten in the same transaction as every cart mutation
+    vendor_id = Column(UUID(as_uuid=True), ForeignKey("profiles.id"), primary_key=True)
+    line_count = Column(Integer, default=0, nullable=False)
+    base_total = Column(Numeric(12, 2), default=0, nullable=False)  # Sum of quantity * base_price
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 # In models.py
 
 class Application(Base):
@@ -105,6 +142,7 @@ class DeliveryRoute(Base):
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     agent_id = Column(UUID(as_uuid=True), ForeignKey("profiles.id"), nullable=False)
+    run_id = Column(UUID(as_uuid=True), ForeignKey("finalization_runs.id"), nullable=True, index=True)  # Finalization run that generated the route
     route_date = Column(DateTime(timezone=True), server_default=func.now())
     status = Column(String, default='assigned', nullable=False)  # assigned, in_progress, completed
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -129,4 +167,75 @@ class RouteStop(Base):
     
     # Relationships
     route = relationship("DeliveryRoute", back_populates="stops")
-    profile = relationship("Profile")
\ No newline at end of file
+    profile = relationship("Profile")
+
+class FinalizationRun(Base):
+    __tablename__ = "finalization_runs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    status = Column(String, default='running', nullable=False)  # running, completed, failed, abandoned
+    stage = Column(String, default='pricing', nullable=False)  # pricing, finalizing, routing, done
+    cutoff_at = Column(DateTime(timezone=True), nullable=False)  # Also the finalized_at stamp of every item in the run
+    chunk_size = Column(Integer, nullable=False)
+    last_vendor_id = Column(UUID(as_uuid=True), nullable=True)  # Checkpoint: last vendor committed
+    total_vendors = Column(Integer, default=0, nullable=False)
+    processed_vendors = Column(Integer, default=0, nullable=False)
+    finalized_items = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class FinalizationPrice(Base):
+    __tablename__ = "finalization_prices"
+
+    # Unit prices frozen at the start of a run, so every chunk sees the same collective demand
+    run_id = Column(UUID(as_uuid=True), ForeignKey("finalization_runs.id"), primary_key=True)
+    product_id = Column(UUID(as_uuid=True), ForeignKey("products.id"), primary_key=True)
+    unit_price = Column(Numeric(10, 2), nullable=False)
+
+
+class WalletTransaction(Base):
+    __tablename__ = "wallet_transactions"
+    __table_args__ = (
+        # Backstop for idempotent top-ups (ON CONFLICT DO NOTHING) and debits (skipped when already recorded)
+        UniqueConstraint("user_id", "kind", "reference", name="uq_wallet_transactions_user_kind_reference"),
+    )
+
+    # Insert-only ledger: rows are never updated or deleted
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("profiles.id"), nullable=False, index=True)
+    amount = Column(Numeric(10, 2), nullable=False)  # Positive for credits, negative for debits
+    kind = Column(String, nullable=False)  # opening_balance, topup, order_debit
+    reference = Column(String, nullable=True)  # Razorpay payment id, finalization run id, ...
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class WalletBalance(Base):
+    __tablename__ = "wallet_balances"
+
+    # Running total of wallet_transactions per user, maintained in the same transaction as each ledger insert
+    user_id = Column(UUID(as_uuid=True), ForeignKey("profiles.id"), primary_key=True)
+    balance = Column(Numeric(12, 2), default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        # Only pending rows are ever claimed, so keep the index to those
+        Index("ix_notification_outbox_pending", "available_at", postgresql_where=text("status = 'pending'")),
+    )
+
+    # Written in the same transaction as the business change, delivered later by utils/outbox_worker.py
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    channel = Column(String, default='sms', nullable=False)
+    recipient = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String, default='pending', nullable=False)  # pending, sent, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+    available_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)  # Not claimed before this (retry backoff)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
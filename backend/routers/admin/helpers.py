@@ -11,6 +11,7 @@ from sqlalchemy import select, func
 from datetime import datetime
 
 from config import supabase_admin
+from dependencies.get_current_user import invalidate_user_role
 from models import Profile
 from routers.admin.schemas import UserListItem, UserListResponse, RoleUpdateResponse
 from routers.users.helpers import get_all_user_profiles
@@ -215,6 +216,7 @@ async def update_user_role_admin(
                 )
             
             logger.info(f"Updated Supabase user metadata for {user_id} with role: {new_role}")
+            invalidate_user_role(user_id)
             
         except Exception as supabase_error:
             logger.error(f"Failed to update Supabase metadata: {str(supabase_error)}")
@@ -82,8 +82,14 @@ async def get_stop_manifest(
     if stop.stop_type == 'pickup':
         # **NEW LOGIC FOR PICKUP**
         # Get all items from this specific supplier and load the vendor's name
+        # Only for vendors delivered on this route; other agents pick up the rest
+        route_vendor_ids = select(RouteStop.profile_id).where(
+            RouteStop.route_id == stop.route_id,
+            RouteStop.stop_type == 'delivery'
+        )
         manifest_query = base_items_query.join(Product).where(
-            Product.supplier_id == stop.profile_id
+            Product.supplier_id == stop.profile_id,
+            CartItem.vendor_id.in_(route_vendor_ids)
         ).options(
             selectinload(CartItem.product),
             selectinload(CartItem.vendor) # Eager load the vendor's profile
@@ -7,7 +7,7 @@ import os
 
 # Import all the necessary tools
 from dependencies.rbac import require_permission
-from dependencies.get_current_user import get_current_user
+from dependencies.get_current_user import get_current_user, invalidate_user_role
 from config import get_db, supabase_admin, supabase
 from models import Application as ApplicationModel, Role, Profile
 from .schemas import ApplicationCreate, Application as ApplicationSchema, ApplicationAdminUpdate, DocumentUploadResponse
@@ -215,4 +215,7 @@ async def review_application(
     await db.commit()
     await db.refresh(application)
 
+    if update_data.status == 'approved':
+        invalidate_user_role(application.user_id)
+
     return application
\ No newline at end of file
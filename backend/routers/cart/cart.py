@@ -1,16 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 import uuid
 from typing import List
 
-from dependencies.rbac import require_permission
+from dependencies.rbac import require_permission, has_permission
 from dependencies.get_current_user import get_current_user
 from config import get_db
 from models import CartItem as CartItemModel
 # Import the new, improved schemas
-from .schemas import CartItemCreate, CartView, CartItem as CartItemSchema, CartItemUpdate
+from .schemas import CartItemCreate, CartView, CartItem as CartItemSchema, CartItemUpdate, CartBatchRequest
+from .helpers import (
+    apply_demand_delta, lock_vendor_carts, upsert_cart_line, apply_cart_batch, refresh_cart_summaries, get_cart_summary, get_cart_view
+)
+from ..products.stream import publish_demand_change
 
 cart_router = APIRouter(prefix="/cart", tags=["Shopping Cart"])
 
@@ -24,34 +27,48 @@ async def add_item_to_cart(
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Endpoint for a vendor to add a product to their cart. If the item already exists, its quantity is increased."""
+    """
+    Endpoint for a vendor to add a product to their cart. If the item already exists, its quantity is increased.
+    One statement locks the cart and upserts the line and the demand counter, so concurrent adds of the same
+    product cannot create duplicate lines; a second one recomputes the cart summary (see upsert_cart_line).
+    After the commit, publishing the change costs a deals query only while someone follows the product's stream.
+    """
     vendor_id = uuid.UUID(current_user.get("user_id"))
 
-    query = select(CartItemModel).where(
-        CartItemModel.vendor_id == vendor_id,
-        CartItemModel.product_id == item_data.product_id,
-        CartItemModel.is_finalized == False
-    )
-    existing_item = (await db.execute(query)).scalar_one_or_none()
-
-    if existing_item:
-        existing_item.quantity += item_data.quantity
-        await db.commit()
-        # Refresh the relationship to include product details in the response
-        await db.refresh(existing_item, attribute_names=['product'])
-        return existing_item
-
-    new_cart_item = CartItemModel(
-        id=uuid.uuid4(),
-        vendor_id=vendor_id,
-        product_id=item_data.product_id,
-        quantity=item_data.quantity
-    )
-    db.add(new_cart_item)
+    line = await upsert_cart_line(db, vendor_id, item_data.product_id, item_data.quantity)
     await db.commit()
-    await db.refresh(new_cart_item, attribute_names=['product'])
-    
-    return new_cart_item
+    await publish_demand_change(db, item_data.product_id, line.demand, item_data.quantity)
+
+    return {"id": line.id, "quantity": line.quantity, "product": line.Product}
+
+@cart_router.post(
+    "/items:batch",
+    response_model=CartView,
+    dependencies=[Depends(require_permission(resource="cart", permission="write"))]
+)
+async def apply_cart_operations(
+    batch: CartBatchRequest,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Endpoint for a vendor to sync several cart changes in one call.
+    Operations (add/update/remove by product) are applied in order, all in one transaction,
+    and the resulting cart is returned.
+    """
+    vendor_id = uuid.UUID(current_user.get("user_id"))
+
+    if any(operation.op == "remove" for operation in batch.operations) \
+            and not has_permission(current_user.get("role", "user"), "cart", "delete"):
+        raise HTTPException(status_code=403, detail="Access denied. Removing cart items requires delete permission for cart")
+
+    demand_changes = await apply_cart_batch(db, vendor_id, batch.operations)
+    cart = await get_cart_view(db, vendor_id)
+    await db.commit()
+
+    for product_id, (demand, delta) in demand_changes.items():
+        await publish_demand_change(db, product_id, demand, delta)
+    return cart
 
 @cart_router.get(
     "/me",
@@ -67,27 +84,7 @@ async def get_my_cart(
     IMPROVEMENT: Now eagerly loads product details and calculates the estimated total price.
     """
     vendor_id = uuid.UUID(current_user.get("user_id"))
-
-    query = select(CartItemModel).options(
-        selectinload(CartItemModel.product) # This is the key improvement
-    ).where(
-        CartItemModel.vendor_id == vendor_id,
-        CartItemModel.is_finalized == False
-    )
-    
-    cart_items = (await db.execute(query)).scalars().all()
-    
-    # --- ADDED: Calculate the estimated total price based on base prices ---
-    estimated_total = 0.0
-    for item in cart_items:
-        if item.product and item.product.base_price:
-            estimated_total += item.quantity * float(item.product.base_price)
-
-    return {
-        "items": cart_items,
-        "total_items": len(cart_items),
-        "estimated_total": estimated_total
-    }
+    return await get_cart_view(db, vendor_id)
 
 @cart_router.get(
     "/me/affordability-check",
@@ -100,40 +97,23 @@ async def check_cart_affordability(
     """
     Endpoint for a vendor to check if they can afford their current cart.
     Returns wallet balance, estimated cost, and affordability status.
+    Affordability is judged on base prices; projected_total is what the cart would cost
+    with the deals current demand has unlocked.
     """
-    from models import Profile
-    
     vendor_id = uuid.UUID(current_user.get("user_id"))
 
-    # Get vendor's current wallet balance
-    profile_query = select(Profile).where(Profile.id == vendor_id)
-    vendor_profile = (await db.execute(profile_query)).scalar_one_or_none()
-    
-    if not vendor_profile:
-        raise HTTPException(status_code=404, detail="Vendor profile not found.")
-
-    # Get current cart items and calculate estimated total
-    cart_query = select(CartItemModel).options(
-        selectinload(CartItemModel.product)
-    ).where(
-        CartItemModel.vendor_id == vendor_id,
-        CartItemModel.is_finalized == False
-    )
-    
-    cart_items = (await db.execute(cart_query)).scalars().all()
-    
-    estimated_total = 0.0
-    for item in cart_items:
-        if item.product and item.product.base_price:
-            estimated_total += item.quantity * float(item.product.base_price)
+    # Wallet balance and cart totals in one read
+    summary = await get_cart_summary(db, vendor_id, with_balance=True)
+    wallet_balance = summary["wallet_balance"]
+    estimated_total = summary["base_total"]
 
-    wallet_balance = float(vendor_profile.wallet_balance or 0)
     can_afford = wallet_balance >= estimated_total
     shortfall = max(0, estimated_total - wallet_balance)
 
     return {
         "wallet_balance": wallet_balance,
         "estimated_total": estimated_total,
+        "projected_total": summary["projected_total"],
         "can_afford": can_afford,
         "shortfall": shortfall,
         "message": "You can afford this cart!" if can_afford else f"You need ₹{shortfall:.2f} more in your wallet."
@@ -152,11 +132,12 @@ async def update_cart_item_quantity(
 ):
     """Endpoint for a vendor to update the quantity of an item in their cart."""
     vendor_id = uuid.UUID(current_user.get("user_id"))
+    await lock_vendor_carts(db, [vendor_id])  # Keeps the demand delta exact under concurrent cart writes
 
     query = select(CartItemModel).where(
         CartItemModel.id == item_id,
         CartItemModel.vendor_id == vendor_id
-    )
+    ).with_for_update()
     item_to_update = (await db.execute(query)).scalar_one_or_none()
 
     if not item_to_update:
@@ -165,8 +146,12 @@ async def update_cart_item_quantity(
     if item_to_update.is_finalized:
         raise HTTPException(status_code=400, detail="Cannot update items in a finalized order.")
 
+    delta = item_data.quantity - item_to_update.quantity
+    demand = await apply_demand_delta(db, item_to_update.product_id, delta)
     item_to_update.quantity = item_data.quantity
+    await refresh_cart_summaries(db, [vendor_id])
     await db.commit()
+    await publish_demand_change(db, item_to_update.product_id, demand, delta)
     await db.refresh(item_to_update, attribute_names=['product'])
 
     return item_to_update
@@ -183,11 +168,12 @@ async def remove_item_from_cart(
 ):
     """Endpoint for a vendor to remove an item from their cart."""
     vendor_id = uuid.UUID(current_user.get("user_id"))
+    await lock_vendor_carts(db, [vendor_id])
 
     query = select(CartItemModel).where(
         CartItemModel.id == item_id,
         CartItemModel.vendor_id == vendor_id
-    )
+    ).with_for_update()
     item_to_delete = (await db.execute(query)).scalar_one_or_none()
 
     if item_to_delete:
@@ -195,6 +181,9 @@ async def remove_item_from_cart(
             raise HTTPException(status_code=400, detail="Cannot delete items from a finalized order.")
         
         await db.delete(item_to_delete)
+        demand = await apply_demand_delta(db, item_to_delete.product_id, -item_to_delete.quantity)
+        await refresh_cart_summaries(db, [vendor_id])
         await db.commit()
+        await publish_demand_change(db, item_to_delete.product_id, demand, -item_to_delete.quantity)
 
     return
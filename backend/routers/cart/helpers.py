@@ -0,0 +1,335 @@
+"""
+Helper functions for cart operations
+Keeps the product_demand counters and the per-vendor cart_summaries in step with
+the cart, and holds the set-based cart writes (add-to-cart upsert, batch sync)
+and the cart reads built on the summaries
+
+Every change to a non-finalized cart line moves the collective demand of its
+product by the same amount. The change is applied as a delta in the caller's
+transaction, so the counter commits (or rolls back) together with the cart row
+and readers get current demand from one row per product.
+
+Every write to a vendor's open lines first takes that vendor's cart lock
+(lock_vendor_carts), so writers that read the cart before changing it see a
+state no concurrent writer can change under them - including lines that do
+not exist yet, which row locks cannot cover.
+
+Cart summaries are not maintained with deltas: every write path (add,
+update, remove, batch, finalization, a product price change) recomputes the
+summaries of the vendors it touched from their open lines, with
+refresh_cart_summaries, while holding their cart locks.
+"""
+import uuid
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, func, true, and_, literal
+from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.postgresql import Insert, insert as pg_insert
+from sqlalchemy.engine import Row
+
+from models import CartItem, CartSummary, Deal, Product, ProductDemand, Profile, WalletBalance
+from .schemas import CartBatchOperation
+
+
+# pg_advisory_xact_lock takes at most this many keys per statement (one column each)
+_LOCKS_PER_STATEMENT = 1000
+
+
+def _cart_lock_key(vendor_id: uuid.UUID) -> int:
+    """Advisory lock key of a vendor's cart: the first 64 bits of the vendor id."""
+    return int.from_bytes(vendor_id.bytes[:8], "big", signed=True)
+
+
+async def lock_vendor_carts(db: AsyncSession, vendor_ids: Iterable[uuid.UUID]) -> None:
+    """
+    Take the cart locks of some vendors, held until the transaction ends.
+
+    Keys are locked in ascending order (left to right within a statement), so
+    writers locking overlapping sets of vendors cannot deadlock. The locks are
+    re-entrant within a transaction.
+
+    Args:
+        db: Database session (not committed here)
+        vendor_ids: Vendors whose carts are about to change
+    """
+    keys = sorted({_cart_lock_key(vendor_id) for vendor_id in vendor_ids})
+    for start in range(0, len(keys), _LOCKS_PER_STATEMENT):
+        batch = keys[start:start + _LOCKS_PER_STATEMENT]
+        await db.execute(select(*(func.pg_advisory_xact_lock(key) for key in batch)))
+
+
+def _demand_upsert(statement: Insert) -> Insert:
+    """Turn an INSERT of (product_id, quantity delta) rows into a counter increment returning the new demand."""
+    return statement.on_conflict_do_update(
+        index_elements=[ProductDemand.product_id],
+        set_={"quantity": ProductDemand.quantity + statement.excluded.quantity, "updated_at": func.now()}
+    ).returning(ProductDemand.product_id, ProductDemand.quantity)
+
+
+async def apply_demand_deltas(db: AsyncSession, deltas: Dict[uuid.UUID, int]) -> Dict[uuid.UUID, int]:
+    """
+    Add quantity deltas to the demand counters of several products in one statement.
+
+    Rows are written in product id order, so concurrent writers touching the
+    same products lock them in the same order and cannot deadlock.
+
+    Args:
+        db: Database session (not committed here)
+        deltas: Product id -> change in non-finalized quantity (negative to decrease)
+
+    Returns:
+        dict: Product id -> demand after the change, for the products that changed
+    """
+    rows = [
+        {"product_id": product_id, "quantity": delta}
+        for product_id, delta in sorted(deltas.items()) if delta
+    ]
+    if not rows:
+        return {}
+
+    result = await db.execute(_demand_upsert(pg_insert(ProductDemand).values(rows)))
+    return {product_id: quantity for product_id, quantity in result.all()}
+
+
+async def apply_demand_delta(db: AsyncSession, product_id: uuid.UUID, delta: int) -> Optional[int]:
+    """Add a quantity delta to one product's demand counter; returns the new demand (None if delta is 0)."""
+    return (await apply_demand_deltas(db, {product_id: delta})).get(product_id)
+
+
+async def upsert_cart_line(db: AsyncSession, vendor_id: uuid.UUID, product_id: uuid.UUID, quantity: int) -> Row:
+    """
+    Add a quantity to a vendor's open cart line for a product, creating the line if needed.
+
+    Two round trips. The first statement takes the vendor's cart lock and does
+    the add: the line upsert (against the partial unique index on open lines)
+    and the demand counter increment both select from the lock CTE, so neither
+    writes before the lock is held, and the product for the response is
+    joined in. Both writes are increments resolved against the latest row
+    versions, so they stay exact even though the statement's snapshot predates
+    the lock. The cart summary recompute cannot join that statement: it reads
+    the vendor's lines, and only a statement started after the lock is held
+    sees the writes of the request that held it before. It runs second, like
+    on every other cart write.
+
+    Args:
+        db: Database session (not committed here)
+        vendor_id: Cart owner
+        product_id: Product being added
+        quantity: Quantity to add (> 0)
+
+    Returns:
+        Row: (id, quantity, Product, demand) - the line after the add, its
+        product and the product's demand after the add
+    """
+    cart_lock = select(func.pg_advisory_xact_lock(_cart_lock_key(vendor_id)).label("locked")).cte("cart_lock")
+
+    line = pg_insert(CartItem).from_select(
+        ["id", "vendor_id", "product_id", "quantity"],
+        select(
+            literal(uuid.uuid4(), CartItem.id.type),
+            literal(vendor_id, CartItem.vendor_id.type),
+            literal(product_id, CartItem.product_id.type),
+            literal(quantity)
+        ).select_from(cart_lock)
+    )
+    line = line.on_conflict_do_update(
+        index_elements=[CartItem.vendor_id, CartItem.product_id],
+        index_where=CartItem.is_finalized == False,
+        set_={"quantity": CartItem.quantity + line.excluded.quantity}
+    ).returning(CartItem.id, CartItem.product_id, CartItem.quantity).cte("line")
+
+    demand = _demand_upsert(pg_insert(ProductDemand).from_select(
+        ["product_id", "quantity"],
+        select(literal(product_id, ProductDemand.product_id.type), literal(quantity)).select_from(cart_lock)
+    )).cte("demand")
+
+    query = select(
+        line.c.id, line.c.quantity, Product, demand.c.quantity.label("demand")
+    ).select_from(line).join(
+        Product, Product.id == line.c.product_id
+    ).join(demand, true())
+
+    added = (await db.execute(query)).one()
+    await refresh_cart_summaries(db, [vendor_id])
+    return added
+
+
+async def refresh_cart_summaries(db: AsyncSession, vendor_ids: List[uuid.UUID]) -> None:
+    """
+    Recompute the cart summaries of some vendors from their open lines.
+
+    Summaries are only ever recomputed, never incremented, and the caller must
+    hold the vendors' cart locks (lock_vendor_carts): a recompute then reads
+    lines no other writer is changing, and the last one to commit is current.
+
+    Args:
+        db: Database session (not committed here)
+        vendor_ids: Vendors whose summaries are recomputed
+    """
+    if not vendor_ids:
+        return
+    totals = select(
+        Profile.id,
+        func.count(CartItem.id),
+        func.coalesce(func.sum(CartItem.quantity * Product.base_price), 0)
+    ).select_from(Profile).outerjoin(
+        CartItem, and_(CartItem.vendor_id == Profile.id, CartItem.is_finalized == False)
+    ).outerjoin(
+        Product, Product.id == CartItem.product_id
+    ).where(Profile.id.in_(vendor_ids)).group_by(Profile.id)
+
+    statement = pg_insert(CartSummary).from_select(["vendor_id", "line_count", "base_total"], totals)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[CartSummary.vendor_id],
+        set_={
+            "line_count": statement.excluded.line_count,
+            "base_total": statement.excluded.base_total,
+            "updated_at": func.now()
+        }
+    ))
+
+
+def _projected_total(vendor_id: uuid.UUID):
+    """
+    What the vendor's open cart would cost if finalization ran now: every line
+    at the best deal its product's current demand unlocks, priced like
+    routers/orders/helpers.product_prices_query.
+    """
+    best_discount = select(func.max(Deal.discount)).where(
+        Deal.product_id == CartItem.product_id,
+        Deal.threshold <= ProductDemand.quantity
+    ).scalar_subquery()
+    unit_price = func.round(Product.base_price * (1 - func.coalesce(best_discount, 0)), 2)
+
+    return select(
+        func.coalesce(func.sum(CartItem.quantity * unit_price), 0)
+    ).select_from(CartItem).join(
+        Product, Product.id == CartItem.product_id
+    ).outerjoin(
+        ProductDemand, ProductDemand.product_id == CartItem.product_id
+    ).where(
+        CartItem.vendor_id == vendor_id,
+        CartItem.is_finalized == False
+    ).scalar_subquery()
+
+
+async def get_cart_summary(db: AsyncSession, vendor_id: uuid.UUID, with_balance: bool = False) -> dict:
+    """
+    Read a vendor's cart totals in one query.
+
+    Returns:
+        dict: line_count, base_total, projected_total (and wallet_balance when
+        with_balance is set), as floats for the JSON responses
+    """
+    columns = [
+        func.coalesce(
+            select(CartSummary.line_count).where(CartSummary.vendor_id == vendor_id).scalar_subquery(), 0
+        ).label("line_count"),
+        func.coalesce(
+            select(CartSummary.base_total).where(CartSummary.vendor_id == vendor_id).scalar_subquery(), 0
+        ).label("base_total"),
+        _projected_total(vendor_id).label("projected_total")
+    ]
+    if with_balance:
+        columns.append(func.coalesce(
+            select(WalletBalance.balance).where(WalletBalance.user_id == vendor_id).scalar_subquery(), 0
+        ).label("wallet_balance"))
+
+    row = (await db.execute(select(*columns))).one()
+    return {key: (value if key == "line_count" else float(value)) for key, value in row._mapping.items()}
+
+
+async def get_cart_view(db: AsyncSession, vendor_id: uuid.UUID) -> dict:
+    """Build the CartView of a vendor's open cart; totals come from the cart summary."""
+    query = select(CartItem).options(
+        selectinload(CartItem.product)
+    ).where(
+        CartItem.vendor_id == vendor_id,
+        CartItem.is_finalized == False
+    )
+    cart_items = (await db.execute(query)).scalars().all()
+    summary = await get_cart_summary(db, vendor_id)
+
+    return {
+        "items": cart_items,
+        "total_items": summary["line_count"],
+        "estimated_total": summary["base_total"],
+        "projected_total": summary["projected_total"]
+    }
+
+
+def _final_quantities(operations: List[CartBatchOperation], current: Dict[uuid.UUID, int]) -> Dict[uuid.UUID, int]:
+    """Replay the operations in order over the current open lines; 0 means no line."""
+    final = {}
+    for operation in operations:
+        quantity = final.get(operation.product_id, current.get(operation.product_id, 0))
+        if operation.op == "add":
+            quantity += operation.quantity
+        elif operation.op == "update":
+            quantity = operation.quantity
+        else:
+            quantity = 0
+        final[operation.product_id] = quantity
+    return final
+
+
+async def apply_cart_batch(
+    db: AsyncSession,
+    vendor_id: uuid.UUID,
+    operations: List[CartBatchOperation]
+) -> Dict[uuid.UUID, tuple]:
+    """
+    Apply a batch of cart operations with one statement per kind of write.
+
+    The vendor's cart lock is taken before the affected open lines are read
+    (and row-locked), so the demand deltas are exact even for lines another
+    request would otherwise create concurrently. The operations are replayed
+    in memory, and the outcome is written as one multi-row upsert, one delete
+    and one demand-counter update.
+
+    Args:
+        db: Database session (not committed here)
+        vendor_id: Cart owner
+        operations: Operations in the order the client sent them
+
+    Returns:
+        dict: Product id -> (demand after the batch, demand delta), for products whose demand changed
+    """
+    await lock_vendor_carts(db, [vendor_id])
+
+    product_ids = sorted({operation.product_id for operation in operations})
+    current_query = select(CartItem.product_id, CartItem.quantity).where(
+        CartItem.vendor_id == vendor_id,
+        CartItem.product_id.in_(product_ids),
+        CartItem.is_finalized == False
+    ).order_by(CartItem.product_id).with_for_update()
+    current = dict((await db.execute(current_query)).all())
+
+    final = _final_quantities(operations, current)
+
+    upserts = [
+        {"id": uuid.uuid4(), "vendor_id": vendor_id, "product_id": product_id, "quantity": quantity}
+        for product_id, quantity in sorted(final.items())
+        if quantity and quantity != current.get(product_id)
+    ]
+    if upserts:
+        statement = pg_insert(CartItem).values(upserts)
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[CartItem.vendor_id, CartItem.product_id],
+            index_where=CartItem.is_finalized == False,
+            set_={"quantity": statement.excluded.quantity}
+        ))
+
+    removed = [product_id for product_id, quantity in final.items() if not quantity and product_id in current]
+    if removed:
+        await db.execute(delete(CartItem).where(
+            CartItem.vendor_id == vendor_id,
+            CartItem.product_id.in_(removed),
+            CartItem.is_finalized == False
+        ).execution_options(synchronize_session=False))
+
+    await refresh_cart_summaries(db, [vendor_id])
+
+    deltas = {product_id: quantity - current.get(product_id, 0) for product_id, quantity in final.items()}
+    demand = await apply_demand_deltas(db, deltas)
+    return {product_id: (quantity, deltas[product_id]) for product_id, quantity in demand.items()}
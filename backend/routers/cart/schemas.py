@@ -1,7 +1,7 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 import uuid
 from datetime import datetime
-from typing import List
+from typing import List, Literal
 
 # We need to import the Product schema to nest it in the cart view
 from ..products.schemas import Product as ProductSchema
@@ -17,6 +17,25 @@ class CartItemUpdate(CartItemBase):
     """Schema for updating the quantity of an item."""
     pass
 
+class CartBatchOperation(BaseModel):
+    """
+    One operation of a batch, addressed by product (a vendor has one open line per product).
+    'add' increases the line (creating it), 'update' sets its quantity (creating it), 'remove' deletes it.
+    """
+    op: Literal["add", "update", "remove"]
+    product_id: uuid.UUID
+    quantity: int | None = Field(None, gt=0, description="Required for add and update.")
+
+    @model_validator(mode="after")
+    def check_quantity(self):
+        if self.op != "remove" and self.quantity is None:
+            raise ValueError(f"quantity is required for '{self.op}'")
+        return self
+
+class CartBatchRequest(BaseModel):
+    """Schema for applying several cart operations at once, in order."""
+    operations: List[CartBatchOperation] = Field(..., min_length=1, max_length=100)
+
 class CartItem(BaseModel):
     """
     Schema for viewing a single item in the cart.
@@ -35,4 +54,6 @@ class CartView(BaseModel):
     # --- ADDED ---
     total_items: int
     estimated_total: float
-    """Estimated total price of all items in the cart."""
\ No newline at end of file
+    """Estimated total price of all items in the cart."""
+    projected_total: float
+    """What the cart would cost if orders were finalized now, with the deals current demand has unlocked."""
\ No newline at end of file
@@ -5,6 +5,7 @@ from dependencies.rbac import require_permission
 from dependencies.get_current_user import get_current_user
 from config import get_db
 from models import Deal as DealModel, Product as ProductModel
+from routers.products.cache import catalog_cache
 from .schemas import DealCreate, Deal as DealSchema
 from .schemas import DealUpdate
 from sqlalchemy import select
@@ -51,6 +52,7 @@ async def create_deal_for_product(
     db.add(new_deal)
     await db.commit()
     await db.refresh(new_deal)
+    await catalog_cache.invalidate()
 
     return new_deal
 
@@ -86,6 +88,7 @@ async def update_deal(
     
     await db.commit()
     await db.refresh(deal_to_update)
+    await catalog_cache.invalidate()
     
     return deal_to_update
 
@@ -113,6 +116,7 @@ async def delete_deal(
     if deal_to_delete:
         await db.delete(deal_to_delete)
         await db.commit()
+        await catalog_cache.invalidate()
 
     # Return 204 No Content whether the deal was found or not
     return
\ No newline at end of file
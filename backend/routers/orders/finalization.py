@@ -0,0 +1,372 @@
+"""
+Nightly finalization job
+Runs the finalize-and-route work in vendor chunks, each in its own transaction,
+and records a checkpoint on the FinalizationRun row so a retry resumes where it stopped.
+
+The nightly call resumes an unfinished run only within its window
+(FINALIZATION_WINDOW): a run from an earlier night is marked 'abandoned' and a
+new run takes over its pending items. A run whose routing failed has already
+finalized and charged its items; it is reported as unrouted and retried on
+request, never on the next nightly call. Abandoned runs are reported too.
+
+While a run executes, a heartbeat keeps its updated_at fresh, so a run that
+spends a long time in one stage (route sequencing) is not taken for dead.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, func, and_
+
+from config import AsyncSessionLocal
+from models import Profile, Role, FinalizationRun
+from utils.notifications import enqueue_sms, order_confirmation_sms
+from utils.route_optimizer import StopInput, optimize_stop_sequence, partition_stops
+from routers.wallet.helpers import debit_wallets
+from routers.products.stream import publish_demand_change
+from .helpers import (
+    snapshot_product_prices, count_pending_vendors, get_next_vendor_chunk, finalize_vendor_items,
+    get_vendor_totals, get_route_demand_pairs, get_vendor_quantities, get_profile_coordinates,
+    insert_routes
+)
+
+logger = logging.getLogger(__name__)
+
+FINALIZATION_CHUNK_SIZE = int(os.environ.get("FINALIZATION_CHUNK_SIZE", "200"))
+# A 'running' run without a heartbeat for this long is assumed dead and may be resumed
+FINALIZATION_STALE_AFTER = timedelta(seconds=int(os.environ.get("FINALIZATION_STALE_AFTER_SECONDS", "300")))
+# Runs whose cutoff is older than this belong to an earlier night
+FINALIZATION_WINDOW = timedelta(hours=float(os.environ.get("FINALIZATION_WINDOW_HOURS", "12")))
+# Advisory lock key serializing run creation and resumption
+FINALIZATION_LOCK_KEY = 0x66696E616C
+# Nights with at least this many stops sequence the agents' routes in parallel processes
+ROUTE_PARALLEL_MIN_STOPS = int(os.environ.get("ROUTE_PARALLEL_MIN_STOPS", "300"))
+ROUTE_WORKERS = int(os.environ.get("ROUTE_WORKERS", str(os.cpu_count() or 1)))
+
+# Process pool for route sequencing, owned by the app lifespan (start_route_pool / stop_route_pool)
+_route_pool: Optional[ProcessPoolExecutor] = None
+
+
+def start_route_pool():
+    """
+    Create the shared route-sequencing pool. Workers are spawned, not forked:
+    a fork would copy the running event loop and open database connections.
+    They start on first use, not here.
+    """
+    global _route_pool
+    if _route_pool is None:
+        _route_pool = ProcessPoolExecutor(max_workers=ROUTE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+def stop_route_pool():
+    global _route_pool
+    if _route_pool is not None:
+        _route_pool.shutdown(wait=True, cancel_futures=True)
+        _route_pool = None
+
+
+async def lock_finalization_runs(db: AsyncSession):
+    """Serialize run creation and resumption; the lock is released by the next commit or rollback."""
+    await db.execute(select(func.pg_advisory_xact_lock(FINALIZATION_LOCK_KEY)))
+
+
+async def get_resumable_run(db: AsyncSession) -> Optional[FinalizationRun]:
+    """Get the most recent unfinished run, leaving out abandoned runs and runs whose routing failed."""
+    query = select(FinalizationRun).where(
+        FinalizationRun.status.notin_(('completed', 'abandoned')),
+        ~and_(FinalizationRun.status == 'failed', FinalizationRun.stage == 'routing')
+    ).order_by(FinalizationRun.created_at.desc()).limit(1)
+    return (await db.execute(query)).scalar_one_or_none()
+
+
+async def get_unrouted_run_ids(db: AsyncSession) -> List[uuid.UUID]:
+    """Runs that finalized and charged their items but failed to route them, oldest first."""
+    query = select(FinalizationRun.id).where(
+        FinalizationRun.status == 'failed',
+        FinalizationRun.stage == 'routing'
+    ).order_by(FinalizationRun.created_at)
+    return list((await db.execute(query)).scalars().all())
+
+
+async def get_abandoned_run_ids(db: AsyncSession) -> List[uuid.UUID]:
+    """Runs given up when the next window started; their finalized items may be unrouted. Oldest first."""
+    query = select(FinalizationRun.id).where(
+        FinalizationRun.status == 'abandoned'
+    ).order_by(FinalizationRun.created_at)
+    return list((await db.execute(query)).scalars().all())
+
+
+def is_run_active(run: FinalizationRun) -> bool:
+    """A run is active while it is 'running' and its heartbeat is recent."""
+    if run.status != 'running' or run.updated_at is None:
+        return False
+    return datetime.now(timezone.utc) - run.updated_at < FINALIZATION_STALE_AFTER
+
+
+def is_run_current(run: FinalizationRun) -> bool:
+    """A run is current while its cutoff falls within FINALIZATION_WINDOW."""
+    return datetime.now(timezone.utc) - run.cutoff_at < FINALIZATION_WINDOW
+
+
+async def _resume_run(db: AsyncSession, run: FinalizationRun) -> FinalizationRun:
+    run.status = 'running'
+    run.error = None
+    await db.commit()
+    await db.refresh(run)
+    return run
+
+
+async def start_or_resume_run(db: AsyncSession) -> tuple[FinalizationRun, bool]:
+    """
+    Create a new finalization run, or pick up the last unfinished one.
+
+    An unfinished run from an earlier window, whatever its stage, is marked
+    'abandoned' and a new run is started: re-running it every night would
+    repeat a deterministic failure and keep later nights from finalizing.
+
+    Returns:
+        tuple: (run, should_execute) - should_execute is False when the run is
+        already being executed by another request
+    """
+    await lock_finalization_runs(db)
+    run = await get_resumable_run(db)
+
+    if run is not None:
+        if is_run_active(run):
+            await db.commit()
+            return run, False
+        if is_run_current(run):
+            return await _resume_run(db, run), True
+        run.error = f"Abandoned in the {run.stage} stage when the next window started" + (
+            f" (last error: {run.error})" if run.error else ""
+        )
+        run.status = 'abandoned'
+        logger.error(f"Finalization run {run.id}: {run.error}")
+
+    run = FinalizationRun(
+        id=uuid.uuid4(),
+        cutoff_at=datetime.now(timezone.utc),
+        chunk_size=FINALIZATION_CHUNK_SIZE
+    )
+    db.add(run)
+    await db.commit()
+    await db.refresh(run)
+    return run, True
+
+
+async def retry_failed_run(db: AsyncSession, run_id: uuid.UUID) -> Optional[FinalizationRun]:
+    """
+    Mark a failed or abandoned run as running again, e.g. after agents were
+    added for a run whose routing failed.
+
+    Returns:
+        FinalizationRun: The run to execute, or None if the run does not exist or has not failed
+    """
+    await lock_finalization_runs(db)
+    run = await db.get(FinalizationRun, run_id, with_for_update=True)
+    if run is None or run.status not in ('failed', 'abandoned'):
+        await db.commit()
+        return None
+    return await _resume_run(db, run)
+
+
+async def _price_run(db: AsyncSession, run: FinalizationRun):
+    """Stage 1: freeze deal prices for the run's collective demand."""
+    priced_products = await snapshot_product_prices(db, run.id, run.cutoff_at)
+    run.total_vendors = await count_pending_vendors(db, run.cutoff_at)
+    run.stage = 'finalizing'
+    await db.commit()
+    logger.info(f"Finalization run {run.id}: priced {priced_products} products for {run.total_vendors} vendors")
+
+
+async def _finalize_next_chunk(db: AsyncSession, run: FinalizationRun) -> bool:
+    """
+    Stage 2: finalize and charge one chunk of vendors, then checkpoint.
+
+    Returns:
+        bool: False once there are no vendors left to process
+    """
+    vendor_ids = await get_next_vendor_chunk(db, run.cutoff_at, run.last_vendor_id, run.chunk_size)
+    if not vendor_ids:
+        run.stage = 'routing'
+        await db.commit()
+        return False
+
+    finalized_items, demand_changes = await finalize_vendor_items(db, run.id, run.cutoff_at, vendor_ids)
+    run.finalized_items += finalized_items
+
+    vendor_totals = await get_vendor_totals(db, run.cutoff_at, vendor_ids)
+    debited = await debit_wallets(db, vendor_totals, kind='order_debit', reference=str(run.id))
+
+    for vendor_id in vendor_totals.keys() - {row.id for row in debited}:
+        # The order stays finalized; collecting the shortfall is handled outside this job.
+        logger.warning(f"Vendor {vendor_id} has insufficient funds!")
+
+    # Confirmations go to the outbox in this transaction, so they exist exactly when the debit does
+    await enqueue_sms(db, [
+        order_confirmation_sms(row.phone, vendor_totals[row.id], row.full_name)
+        for row in debited if row.phone
+    ])
+
+    # The checkpoint is committed together with the chunk, so a chunk is either fully applied or not at all
+    run.last_vendor_id = vendor_ids[-1]
+    run.processed_vendors += len(vendor_ids)
+    await db.commit()
+
+    # Finalized items no longer count towards demand; tell the live demand streams.
+    # The chunk is already committed, so a failure here must not fail the run.
+    try:
+        for product_id, (demand, delta) in demand_changes.items():
+            await publish_demand_change(db, product_id, demand, delta)
+    except Exception as e:
+        logger.warning(f"Finalization run {run.id}: could not publish demand changes: {e}")
+        await db.rollback()
+        await db.refresh(run)  # The rollback expired it
+
+    return True
+
+
+def _build_route_stops(
+    demand_pairs: List[Tuple[uuid.UUID, uuid.UUID]],
+    coordinates: Dict[uuid.UUID, Tuple[float, float]]
+) -> List[StopInput]:
+    """One pickup per supplier and one delivery per vendor; a delivery waits for its suppliers' pickups."""
+    suppliers_by_vendor: Dict[uuid.UUID, List[uuid.UUID]] = {}
+    for vendor_id, supplier_id in demand_pairs:
+        suppliers_by_vendor.setdefault(vendor_id, []).append(supplier_id)
+
+    def stop(stop_type, profile_id, depends_on=()):
+        lat, lng = coordinates.get(profile_id, (None, None))
+        return StopInput(key=(stop_type, profile_id), stop_type=stop_type, lat=lat, lng=lng, depends_on=depends_on)
+
+    supplier_ids = list(dict.fromkeys(supplier_id for _, supplier_id in demand_pairs))
+    pickups = [stop('pickup', supplier_id) for supplier_id in supplier_ids]
+    deliveries = [
+        stop('delivery', vendor_id, tuple(('pickup', supplier_id) for supplier_id in supplier_ids_for_vendor))
+        for vendor_id, supplier_ids_for_vendor in suppliers_by_vendor.items()
+    ]
+    return pickups + deliveries
+
+
+async def _sequence_routes(
+    partitions: List[List[StopInput]],
+    starts: List[Optional[Tuple[float, float]]]
+) -> List[List[StopInput]]:
+    """Optimize every agent's stop order; big nights are spread over the shared process pool."""
+    total_stops = sum(len(stops) for stops in partitions)
+    if _route_pool is None or total_stops < ROUTE_PARALLEL_MIN_STOPS or len(partitions) < 2:
+        # Sequencing is CPU-bound; keep it off the event loop
+        return [await asyncio.to_thread(optimize_stop_sequence, stops, start) for stops, start in zip(partitions, starts)]
+
+    loop = asyncio.get_running_loop()
+    return list(await asyncio.gather(*(
+        loop.run_in_executor(_route_pool, optimize_stop_sequence, stops, start)
+        for stops, start in zip(partitions, starts)
+    )))
+
+
+async def _route_run(db: AsyncSession, run: FinalizationRun):
+    """Stage 3: split everything the run finalized between the agents and generate one route per agent."""
+    demand_pairs = await get_route_demand_pairs(db, run.cutoff_at)
+
+    if demand_pairs:
+        agent_query = select(Profile.id).join(Role).where(Role.name == 'agent').order_by(Profile.id)
+        agent_ids = list((await db.execute(agent_query)).scalars().all())
+        if not agent_ids:
+            raise RuntimeError("No delivery agents available to assign route.")
+
+        profile_ids = set(agent_ids)
+        for vendor_id, supplier_id in demand_pairs:
+            profile_ids.update((vendor_id, supplier_id))
+        coordinates = await get_profile_coordinates(db, list(profile_ids))
+        quantities = await get_vendor_quantities(db, run.cutoff_at)
+
+        stops = _build_route_stops(demand_pairs, coordinates)
+        loads = {('delivery', vendor_id): quantity for vendor_id, quantity in quantities.items()}
+        starts = [coordinates.get(agent_id) for agent_id in agent_ids]
+        partitions = await asyncio.to_thread(partition_stops, stops, loads, starts)
+
+        assigned = [(agent_id, stops, start) for agent_id, stops, start in zip(agent_ids, partitions, starts) if stops]
+        routes = await _sequence_routes([stops for _, stops, _ in assigned], [start for _, _, start in assigned])
+
+        route_rows, stop_rows = [], []
+        for (agent_id, _, _), ordered_stops in zip(assigned, routes):
+            route_id = uuid.uuid4()
+            route_rows.append({"id": route_id, "agent_id": agent_id, "run_id": run.id})
+            stop_rows.extend(
+                {
+                    "id": uuid.uuid4(),
+                    "route_id": route_id,
+                    "profile_id": stop.key[1],
+                    "stop_type": stop.stop_type,
+                    "sequence_order": sequence,
+                    "status": 'pending'
+                }
+                for sequence, stop in enumerate(ordered_stops, start=1)
+            )
+        await insert_routes(db, route_rows, stop_rows)
+
+        logger.info(f"Finalization run {run.id}: created {len(assigned)} routes for {len(agent_ids)} agents")
+
+    run.stage = 'done'
+    run.status = 'completed'
+    run.completed_at = datetime.now(timezone.utc)
+    await db.commit()
+
+
+async def _heartbeat(run_id: uuid.UUID):
+    """Touch the run's updated_at every fifth of FINALIZATION_STALE_AFTER, in short transactions of its own."""
+    interval = FINALIZATION_STALE_AFTER.total_seconds() / 5
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(FinalizationRun).where(FinalizationRun.id == run_id).values(updated_at=func.now())
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Finalization run {run_id}: heartbeat failed: {e}")
+
+
+async def execute_finalization_run(run_id: uuid.UUID):
+    """
+    Execute (or resume) a finalization run from its last checkpoint.
+
+    Uses its own session because it runs after the HTTP response has been sent.
+    A heartbeat runs alongside, so the run counts as active however long a
+    single stage takes.
+    """
+    heartbeat = asyncio.create_task(_heartbeat(run_id))
+    try:
+        async with AsyncSessionLocal() as db:
+            run = await db.get(FinalizationRun, run_id)
+            if run is None:
+                logger.error(f"Finalization run {run_id} not found")
+                return
+
+            try:
+                if run.stage == 'pricing':
+                    await _price_run(db, run)
+
+                while run.stage == 'finalizing':
+                    await _finalize_next_chunk(db, run)
+
+                if run.stage == 'routing':
+                    await _route_run(db, run)
+
+                logger.info(f"Finalization run {run.id} completed: {run.finalized_items} items, {run.processed_vendors} vendors")
+
+            except Exception as e:
+                logger.error(f"Finalization run {run_id} failed: {str(e)}")
+                await db.rollback()
+                run.status = 'failed'
+                run.error = str(e)
+                await db.commit()
+    finally:
+        heartbeat.cancel()
@@ -0,0 +1,282 @@
+"""
+Helper functions for the nightly order finalization
+Set-based SQL used by the finalize-and-route job, kept out of the route handlers
+"""
+import logging
+import os
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, update, func, and_, literal, cast
+from geoalchemy2 import Geometry
+
+from models import CartItem, Product, ProductDemand, Deal, Profile, DeliveryRoute, RouteStop, FinalizationPrice
+from routers.cart.helpers import apply_demand_deltas, lock_vendor_carts, refresh_cart_summaries
+
+logger = logging.getLogger(__name__)
+
+# Above this many stops, route stops are written with COPY instead of a batched INSERT
+ROUTE_STOP_COPY_THRESHOLD = int(os.environ.get("ROUTE_STOP_COPY_THRESHOLD", "5000"))
+_ROUTE_STOP_COLUMNS = ["id", "route_id", "profile_id", "stop_type", "sequence_order", "status"]
+
+
+def pending_items_filter(cutoff_at: datetime):
+    """Cart items that belong to a run: not finalized yet and added before its cutoff."""
+    return and_(
+        CartItem.is_finalized == False,
+        CartItem.added_at <= cutoff_at
+    )
+
+
+def product_prices_query(cutoff_at: datetime):
+    """
+    Build the per-product pricing query for all pending cart items.
+
+    Every product with an item pending for the cutoff gets a price. Its
+    collective demand is read from the product_demand counter (0 when there
+    is no counter row), the best deal whose threshold that demand reaches is
+    picked, and one (product_id, unit_price) row per product is returned.
+    """
+    pending = select(CartItem.product_id).where(
+        pending_items_filter(cutoff_at)
+    ).distinct().subquery("pending")
+    demand = func.coalesce(ProductDemand.quantity, 0)
+
+    best_deal = select(
+        pending.c.product_id,
+        func.coalesce(func.max(Deal.discount), 0).label("discount")
+    ).select_from(pending).outerjoin(
+        ProductDemand, ProductDemand.product_id == pending.c.product_id
+    ).outerjoin(Deal, and_(
+        Deal.product_id == pending.c.product_id,
+        Deal.threshold <= demand
+    )).group_by(pending.c.product_id).subquery("best_deal")
+
+    return select(
+        Product.id.label("product_id"),
+        (Product.base_price * (1 - best_deal.c.discount)).label("unit_price")
+    ).join(best_deal, best_deal.c.product_id == Product.id)
+
+
+async def snapshot_product_prices(db: AsyncSession, run_id: uuid.UUID, cutoff_at: datetime) -> int:
+    """
+    Freeze the unit price of every product with pending items for a run.
+
+    Demand is read from the live counters when the run is priced, which is
+    right after its cutoff; items added in between count towards the price
+    but are left for the next run.
+
+    Args:
+        db: Database session
+        run_id: Finalization run the prices belong to
+        cutoff_at: Products with an item pending up to this moment are priced
+
+    Returns:
+        int: Number of products priced
+    """
+    prices = product_prices_query(cutoff_at).subquery("prices")
+
+    result = await db.execute(
+        insert(FinalizationPrice).from_select(
+            ["run_id", "product_id", "unit_price"],
+            select(literal(run_id, FinalizationPrice.run_id.type), prices.c.product_id, prices.c.unit_price)
+        )
+    )
+    return result.rowcount
+
+
+async def count_pending_vendors(db: AsyncSession, cutoff_at: datetime) -> int:
+    """Count the vendors with at least one cart item pending for the cutoff."""
+    query = select(func.count(func.distinct(CartItem.vendor_id))).where(
+        pending_items_filter(cutoff_at)
+    )
+    return (await db.execute(query)).scalar_one()
+
+
+async def get_next_vendor_chunk(
+    db: AsyncSession,
+    cutoff_at: datetime,
+    after_vendor_id: Optional[uuid.UUID],
+    chunk_size: int
+) -> List[uuid.UUID]:
+    """
+    Get the next chunk of vendors with pending items, in vendor id order.
+
+    Args:
+        db: Database session
+        cutoff_at: Run cutoff
+        after_vendor_id: Checkpoint of the run (last vendor already committed)
+        chunk_size: Maximum number of vendors to return
+    """
+    query = select(CartItem.vendor_id).where(
+        pending_items_filter(cutoff_at)
+    ).distinct().order_by(CartItem.vendor_id).limit(chunk_size)
+
+    if after_vendor_id is not None:
+        query = query.where(CartItem.vendor_id > after_vendor_id)
+
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+
+async def finalize_vendor_items(
+    db: AsyncSession,
+    run_id: uuid.UUID,
+    cutoff_at: datetime,
+    vendor_ids: List[uuid.UUID]
+) -> Tuple[int, Dict[uuid.UUID, Tuple[int, int]]]:
+    """
+    Finalize the pending cart items of the given vendors at the run's frozen prices.
+
+    Every item is stamped with finalized_at = cutoff_at, which is how the rest
+    of the run finds the items it finalized. The finalized quantities are taken
+    off the product demand counters, and the vendors' cart summaries are
+    recomputed, in the same transaction and under the vendors' cart locks.
+
+    An item whose product has no frozen price (its line only became visible
+    after the run was priced) is left pending for the next run and logged, as
+    the run's checkpoint moves past its vendor.
+
+    Returns:
+        tuple: (number of cart items finalized, product id -> (demand after the
+        chunk, demand delta)) - the changes to publish once the chunk commits
+    """
+    await lock_vendor_carts(db, vendor_ids)
+
+    result = await db.execute(
+        update(CartItem)
+        .where(
+            CartItem.product_id == FinalizationPrice.product_id,
+            FinalizationPrice.run_id == run_id,
+            CartItem.vendor_id.in_(vendor_ids),
+            pending_items_filter(cutoff_at)
+        )
+        .values(
+            final_price=FinalizationPrice.unit_price,
+            is_finalized=True,
+            finalized_at=cutoff_at
+        )
+        .returning(CartItem.product_id, CartItem.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    finalized = result.all()
+
+    deltas: Dict[uuid.UUID, int] = {}
+    for product_id, quantity in finalized:
+        deltas[product_id] = deltas.get(product_id, 0) - quantity
+    demand = await apply_demand_deltas(db, deltas)
+    await refresh_cart_summaries(db, vendor_ids)
+
+    unpriced = (await db.execute(
+        select(func.count()).select_from(CartItem).where(
+            CartItem.vendor_id.in_(vendor_ids),
+            pending_items_filter(cutoff_at)
+        )
+    )).scalar_one()
+    if unpriced:
+        logger.warning(
+            f"Finalization run {run_id}: {unpriced} pending cart items had no frozen price "
+            f"and were left for the next run"
+        )
+
+    return len(finalized), {product_id: (quantity, deltas[product_id]) for product_id, quantity in demand.items()}
+
+
+async def get_vendor_totals(
+    db: AsyncSession,
+    finalized_at: datetime,
+    vendor_ids: Optional[List[uuid.UUID]] = None
+) -> Dict[uuid.UUID, Decimal]:
+    """Sum what each vendor owes for the items finalized at the given timestamp."""
+    query = select(
+        CartItem.vendor_id,
+        func.sum(CartItem.final_price * CartItem.quantity)
+    ).where(
+        CartItem.finalized_at == finalized_at
+    ).group_by(CartItem.vendor_id)
+
+    if vendor_ids is not None:
+        query = query.where(CartItem.vendor_id.in_(vendor_ids))
+
+    result = await db.execute(query)
+    return {vendor_id: total for vendor_id, total in result.all()}
+
+
+async def get_route_demand_pairs(db: AsyncSession, finalized_at: datetime) -> List[Tuple[uuid.UUID, uuid.UUID]]:
+    """
+    List which vendor needs goods from which supplier among the items finalized at the given timestamp.
+
+    Returns:
+        List: (vendor_id, supplier_id) pairs; the pickups and deliveries of the route
+    """
+    query = select(CartItem.vendor_id, Product.supplier_id).join(
+        Product, CartItem.product_id == Product.id
+    ).where(
+        CartItem.finalized_at == finalized_at
+    ).distinct()
+
+    result = await db.execute(query)
+    return [(vendor_id, supplier_id) for vendor_id, supplier_id in result.all()]
+
+
+async def get_vendor_quantities(db: AsyncSession, finalized_at: datetime) -> Dict[uuid.UUID, int]:
+    """Total quantity each vendor receives from the items finalized at the given timestamp."""
+    query = select(CartItem.vendor_id, func.sum(CartItem.quantity)).where(
+        CartItem.finalized_at == finalized_at
+    ).group_by(CartItem.vendor_id)
+
+    result = await db.execute(query)
+    return {vendor_id: int(quantity) for vendor_id, quantity in result.all()}
+
+
+async def get_profile_coordinates(
+    db: AsyncSession,
+    profile_ids: List[uuid.UUID]
+) -> Dict[uuid.UUID, Tuple[float, float]]:
+    """
+    Get (lat, lng) for the given profiles. Profiles without a location are left out.
+    """
+    if not profile_ids:
+        return {}
+
+    point = cast(Profile.location, Geometry)
+    query = select(Profile.id, func.ST_Y(point), func.ST_X(point)).where(
+        Profile.id.in_(profile_ids),
+        Profile.location.isnot(None)
+    )
+
+    result = await db.execute(query)
+    return {profile_id: (lat, lng) for profile_id, lat, lng in result.all()}
+
+
+async def insert_routes(db: AsyncSession, routes: List[dict], stops: List[dict]) -> None:
+    """
+    Persist delivery routes and their stops in a couple of round trips.
+
+    Both lists go through one executemany INSERT each (asyncpg batches the rows);
+    nights with more than ROUTE_STOP_COPY_THRESHOLD stops write them with COPY
+    on the session's own connection, so they stay inside the transaction.
+
+    Args:
+        db: Database session
+        routes: DeliveryRoute rows (id, agent_id, run_id)
+        stops: RouteStop rows keyed by the column names in _ROUTE_STOP_COLUMNS
+    """
+    if not routes:
+        return
+
+    await db.execute(insert(DeliveryRoute), routes)
+
+    if len(stops) <= ROUTE_STOP_COPY_THRESHOLD:
+        await db.execute(insert(RouteStop), stops)
+        return
+
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        RouteStop.__tablename__,
+        records=[tuple(stop[column] for column in _ROUTE_STOP_COLUMNS) for stop in stops],
+        columns=_ROUTE_STOP_COLUMNS
+    )
@@ -1,9 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 import uuid
-from collections import defaultdict
 from datetime import date
 from typing import List
 from ..cart.schemas import CartItem as CartItemSchema
@@ -12,106 +11,96 @@ from dependencies.security import verify_internal_secret
 from dependencies.rbac import require_permission
 from dependencies.get_current_user import get_current_user
 from config import get_db
-from models import CartItem, Product, Deal, Profile, Role, DeliveryRoute, RouteStop
-from .schemas import OrderStatus, DeliveryConfirmation, DeliveryFeedback # Import the schema from this folder
-from utils.notifications import send_order_confirmation_sms # Import the new mock function
+from models import CartItem, DeliveryRoute, RouteStop, FinalizationRun
+from .schemas import OrderStatus, DeliveryConfirmation, DeliveryFeedback, FinalizationRunStatus # Import the schema from this folder
+from .finalization import (
+    start_or_resume_run, retry_failed_run, execute_finalization_run, get_unrouted_run_ids, get_abandoned_run_ids
+)
 
 orders_router = APIRouter(prefix="/orders", tags=["Orders & Tracking"])
 
+
+async def _run_status(db: AsyncSession, run: FinalizationRun) -> FinalizationRunStatus:
+    route_ids = (await db.execute(
+        select(DeliveryRoute.id).where(DeliveryRoute.run_id == run.id)
+    )).scalars().all()
+    return FinalizationRunStatus.model_validate(run).model_copy(update={
+        "route_ids": list(route_ids),
+        "unrouted_runs": await get_unrouted_run_ids(db),
+        "abandoned_runs": await get_abandoned_run_ids(db)
+    })
+
+
 @orders_router.post(
     "/finalize-and-route",
+    response_model=FinalizationRunStatus,
+    status_code=status.HTTP_202_ACCEPTED,
     dependencies=[Depends(verify_internal_secret)]
 )
-async def finalize_and_create_routes(db: AsyncSession = Depends(get_db)):
+async def finalize_and_create_routes(
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
     """
     THE BRAIN: This endpoint runs automatically via cron job.
+    It starts (or resumes) a finalization run and returns immediately; the run
+    executes in the background in vendor chunks:
     1. Finalizes all cart items with the best possible deal price.
     2. Deducts payment from vendor wallets and sends notifications.
-    3. Generates and assigns the delivery route.
+    3. Splits the stops between the delivery agents and generates one route per agent.
+    Poll GET /orders/finalize-and-route/{run_id} for progress.
+    A run whose routing failed is not retried here: it is listed in unrouted_runs
+    and resumed with POST /orders/finalize-and-route/{run_id}/retry. An unfinished
+    run from an earlier night is not resumed either: it is listed in abandoned_runs.
     """
-    # --- Part 1: Finalize Deals (The "Deal Activation Engine") ---
-    cart_query = select(CartItem).options(
-        selectinload(CartItem.product).selectinload(Product.deals)
-    ).where(CartItem.is_finalized == False)
-    all_items = (await db.execute(cart_query)).scalars().all()
-
-    if not all_items:
-        return {"message": "No pending orders to finalize."}
-
-    total_demand = defaultdict(int)
-    for item in all_items:
-        total_demand[item.product_id] += item.quantity
-
-    for item in all_items:
-        best_discount = 0.0
-        for deal in item.product.deals:
-            if total_demand[item.product_id] >= deal.threshold and deal.discount > best_discount:
-                best_discount = float(deal.discount)
-        
-        item.final_price = float(item.product.base_price) * (1 - best_discount)
-        item.is_finalized = True
-
-    # --- Part 2: Deduct Payments & Send Notifications ---
-    vendor_totals = defaultdict(float)
-    for item in all_items:
-        vendor_totals[item.vendor_id] += float(item.final_price) * item.quantity
-
-    # Fetch all relevant vendor profiles at once
-    vendor_ids = list(vendor_totals.keys())
-    profiles_query = select(Profile).where(Profile.id.in_(vendor_ids))
-    vendor_profiles = (await db.execute(profiles_query)).scalars().all()
-    
-    profile_map = {p.id: p for p in vendor_profiles}
-
-    for vendor_id, total_cost in vendor_totals.items():
-        if vendor_id in profile_map:
-            vendor_profile = profile_map[vendor_id]
-            if vendor_profile.wallet_balance >= total_cost:
-                vendor_profile.wallet_balance -= total_cost
-                
-                # --- NEW LOGIC: Send SMS notification after successful payment ---
-                if vendor_profile.phone:
-                    await send_order_confirmation_sms(
-                        phone_number=vendor_profile.phone,
-                        final_cost=total_cost,
-                        vendor_name=vendor_profile.full_name
-                    )
-                # -----------------------------
-                
-            else:
-                # In a real app, you'd handle this failure (e.g., cancel order, notify)
-                # For the hackathon, we can log it and proceed.
-                print(f"WARNING: Vendor {vendor_id} has insufficient funds!")
-        else:
-            print(f"ERROR: Could not find profile for vendor {vendor_id} to deduct payment.")
+    run, should_execute = await start_or_resume_run(db)
+    if should_execute:
+        background_tasks.add_task(execute_finalization_run, run.id)
+    return await _run_status(db, run)
 
-    # --- Part 3: Generate Route (The "Logistics Engine") ---
-    agent_query = select(Profile).join(Role).where(Role.name == 'agent')
-    agent = (await db.execute(agent_query)).scalars().first()
-    if not agent:
-        raise HTTPException(status_code=500, detail="No delivery agents available to assign route.")
 
-    new_route = DeliveryRoute(id=uuid.uuid4(), agent_id=agent.id)
-    db.add(new_route)
-    
-    pickups = defaultdict(list)
-    deliveries = defaultdict(list)
-    for item in all_items:
-        pickups[item.product.supplier_id].append(item)
-        deliveries[item.vendor_id].append(item)
-
-    sequence = 1
-    # Create PICKUP stops
-    for supplier_id in pickups.keys():
-        db.add(RouteStop(id=uuid.uuid4(), route=new_route, stop_type='pickup', profile_id=supplier_id, sequence_order=sequence))
-        sequence += 1
-    # Create DELIVERY stops
-    for vendor_id in deliveries.keys():
-        db.add(RouteStop(id=uuid.uuid4(), route=new_route, stop_type='delivery', profile_id=vendor_id, sequence_order=sequence))
-        sequence += 1
+@orders_router.get(
+    "/finalize-and-route/{run_id}",
+    response_model=FinalizationRunStatus,
+    dependencies=[Depends(verify_internal_secret)]
+)
+async def get_finalization_run_status(
+    run_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Endpoint for the cron caller to poll the progress of a finalization run.
+    unrouted_runs lists every run whose routing failed, abandoned_runs every run given up when the
+    next window started; those need a retry once the cause is fixed.
+    """
+    run = await db.get(FinalizationRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Finalization run not found.")
 
-    await db.commit()
-    return {"message": "Orders finalized, payments deducted, notifications sent, and route created successfully!", "route_id": new_route.id}
+    return await _run_status(db, run)
+
+
+@orders_router.post(
+    "/finalize-and-route/{run_id}/retry",
+    response_model=FinalizationRunStatus,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(verify_internal_secret)]
+)
+async def retry_finalization_run(
+    run_id: uuid.UUID,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Endpoint to resume a failed or abandoned finalization run from its checkpoint,
+    e.g. re-running the routing stage after delivery agents were added.
+    """
+    run = await retry_failed_run(db, run_id)
+    if not run:
+        raise HTTPException(status_code=409, detail="Only a failed or abandoned finalization run can be retried.")
+
+    background_tasks.add_task(execute_finalization_run, run.id)
+    return await _run_status(db, run)
 
 
 @orders_router.get("/me/latest-status", response_model=OrderStatus)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 import uuid
+from datetime import datetime
 from typing import List
 
 class OrderStatus(BaseModel):
@@ -32,4 +33,23 @@ class DeliveryFeedback(BaseModel):
     confirmed_at: str
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class FinalizationRunStatus(BaseModel):
+    """Progress of a nightly finalize-and-route run."""
+    id: uuid.UUID
+    status: str  # running, completed, failed, abandoned
+    stage: str  # pricing, finalizing, routing, done
+    cutoff_at: datetime
+    total_vendors: int
+    processed_vendors: int
+    finalized_items: int
+    route_ids: List[uuid.UUID] = []  # One route per agent
+    unrouted_runs: List[uuid.UUID] = []  # Runs whose items were finalized and charged but whose routing failed
+    abandoned_runs: List[uuid.UUID] = []  # Unfinished runs given up when the next window started
+    error: str | None = None
+    completed_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,128 @@
+"""
+Catalog cache for the product browsing endpoints
+Holds pre-serialized JSON for the product list and product details, so a cache
+hit costs neither a database round trip nor Pydantic serialization.
+
+Entries are stored under a catalog version; any product or deal mutation bumps
+the version, which orphans every cached entry at once. Without REDIS_URL the
+cache and its version live in this process (other workers notice a change
+when their entries expire, after CATALOG_CACHE_TTL_SECONDS). With REDIS_URL
+(and the `redis` package installed) all workers share entries and version.
+"""
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from fastapi import Request, Response
+
+from utils.cache import TTLCache
+from .helpers import NEXT_CURSOR_HEADER
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # Optional dependency
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL_SECONDS", "30"))
+REDIS_URL = os.environ.get("REDIS_URL")
+
+_VERSION_KEY = "catalog:version"
+
+
+@dataclass
+class CachedJson:
+    body: bytes
+    etag: str
+    next_cursor: Optional[str] = None  # Sent as X-Next-Cursor for paginated lists
+
+    def serialize(self) -> bytes:
+        return f"{self.etag}\n{self.next_cursor or ''}\n".encode() + self.body
+
+    @classmethod
+    def deserialize(cls, raw: bytes) -> "CachedJson":
+        etag, next_cursor, body = raw.split(b"\n", 2)
+        return cls(body, etag.decode(), next_cursor.decode() or None)
+
+
+def make_entry(body: bytes, next_cursor: Optional[str] = None) -> CachedJson:
+    """Wrap a serialized response for the cache, computing its ETag."""
+    digest = hashlib.blake2b(body, digest_size=12)
+    digest.update((next_cursor or "").encode())
+    return CachedJson(body, f'"{digest.hexdigest()}"', next_cursor)
+
+
+class CatalogCache:
+    """Version-invalidated cache of serialized catalog responses."""
+
+    def __init__(self, ttl: float = CATALOG_CACHE_TTL, redis_url: Optional[str] = REDIS_URL):
+        self.ttl = ttl
+        self._local = TTLCache(ttl=ttl, max_size=5000)
+        self._local_version = 0
+        self._redis = None
+        if redis_url:
+            if redis_asyncio is None:
+                logger.warning("REDIS_URL is set but the redis package is not installed; using the in-process catalog cache")
+            else:
+                self._redis = redis_asyncio.from_url(redis_url)
+
+    async def _version(self) -> int:
+        if self._redis is None:
+            return self._local_version
+        return int(await self._redis.get(_VERSION_KEY) or 0)
+
+    async def get_or_load(self, name: str, loader: Callable[[], Awaitable[Optional[CachedJson]]]) -> Optional[CachedJson]:
+        """
+        Return the cached entry for `name`, calling `loader` (which builds one with make_entry) on a miss.
+
+        A loader returning None (e.g. product not found) is not cached.
+        """
+        try:
+            version = await self._version()
+            key = f"catalog:{version}:{name}"
+            cached = self._local.get(key) if self._redis is None else await self._redis.get(key)
+        except Exception as e:
+            logger.warning(f"Catalog cache unavailable, loading from the database: {e}")
+            return await loader()
+
+        if cached is not None:
+            return cached if isinstance(cached, CachedJson) else CachedJson.deserialize(cached)
+
+        entry = await loader()
+        if entry is None:
+            return None
+        if self._redis is None:
+            self._local.set(key, entry)
+        else:
+            try:
+                await self._redis.set(key, entry.serialize(), ex=max(int(self.ttl), 1))
+            except Exception as e:
+                logger.warning(f"Could not store catalog entry {name}: {e}")
+        return entry
+
+    async def invalidate(self):
+        """Orphan every cached entry; call after committing a product or deal change."""
+        self._local_version += 1
+        self._local.clear()
+        if self._redis is not None:
+            try:
+                await self._redis.incr(_VERSION_KEY)
+            except Exception as e:
+                logger.warning(f"Could not bump the shared catalog version: {e}")
+
+
+def cached_json_response(request: Request, entry: CachedJson) -> Response:
+    """Serve a cached entry, answering 304 when the client already has it."""
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if entry.next_cursor:
+        headers[NEXT_CURSOR_HEADER] = entry.next_cursor
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and entry.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,196 @@
+"""
+Streaming export of a supplier's finalized orders
+Rows are read through a server-side cursor in batches of EXPORT_BATCH_SIZE and
+written out batch by batch, so memory stays flat however many orders there are.
+The supplier's order status overview is streamed the same way.
+
+The generator opens its own session: a request-scoped get_db session is closed
+before a StreamingResponse starts sending its body.
+"""
+import csv
+import io
+import json
+import os
+import uuid
+from typing import AsyncIterator, List
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func, case
+from sqlalchemy.sql import Select
+from sqlalchemy.engine import Row
+
+from config import AsyncSessionLocal
+from models import CartItem, Product as ProductModel, Profile
+from .schemas import SupplierOrderItem
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "json": "application/json",
+}
+
+# Same fields, in the same order, as /products/me/orders/details
+EXPORT_COLUMNS = list(SupplierOrderItem.model_fields)
+
+# Order in which the status overview lists its groups
+ORDER_STATUSES = ["received", "preparing", "ready_for_pickup", "picked_up"]
+
+
+def supplier_orders_query(supplier_id: uuid.UUID):
+    """Flat rows of a supplier's finalized order items, newest first (no ORM objects)"""
+    return select(
+        CartItem.id,
+        CartItem.product_id,
+        ProductModel.name.label("product_name"),
+        CartItem.quantity,
+        CartItem.final_price,
+        Profile.full_name.label("vendor_name"),
+        Profile.phone.label("vendor_phone"),
+        CartItem.finalized_at
+    ).join(
+        ProductModel, CartItem.product_id == ProductModel.id
+    ).outerjoin(
+        Profile, CartItem.vendor_id == Profile.id
+    ).where(
+        ProductModel.supplier_id == supplier_id,
+        CartItem.is_finalized == True
+    ).order_by(CartItem.finalized_at.desc(), CartItem.id)
+
+
+def _record(row: Row) -> dict:
+    return {
+        "id": str(row.id),
+        "product_id": str(row.product_id),
+        "product_name": row.product_name,
+        "quantity": row.quantity,
+        "final_price": float(row.final_price) if row.final_price else 0.0,
+        "vendor_name": row.vendor_name or "Unknown",
+        "vendor_phone": row.vendor_phone,
+        "finalized_at": row.finalized_at.isoformat() if row.finalized_at else None
+    }
+
+
+def status_overview_query(supplier_id: uuid.UUID):
+    """
+    A supplier's finalized order items with their preparation status, grouped
+    by status in ORDER_STATUSES order.
+
+    There is no status tracking yet: like before, the n-th order (newest first)
+    is given a simulated status from n % 4.
+    """
+    orders = supplier_orders_query(supplier_id).add_columns(
+        (func.row_number().over(order_by=(CartItem.finalized_at.desc(), CartItem.id)) - 1).label("position")
+    ).order_by(None).subquery("orders")
+
+    slot = orders.c.position % 4
+    status = case(
+        (slot == 0, "picked_up"),
+        (slot == 1, "ready_for_pickup"),
+        (slot == 2, "preparing"),
+        else_="received"
+    )
+    return select(
+        orders.c.id, orders.c.product_name, orders.c.quantity, orders.c.vendor_name, orders.c.finalized_at,
+        status.label("status")
+    ).order_by(slot.desc(), orders.c.position)
+
+
+async def _row_batches(query: Select) -> AsyncIterator[List[Row]]:
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield rows
+
+
+async def _ndjson(supplier_id: uuid.UUID) -> AsyncIterator[str]:
+    async for rows in _row_batches(supplier_orders_query(supplier_id)):
+        yield "".join(json.dumps(_record(row)) + "\n" for row in rows)
+
+
+async def _json_array(supplier_id: uuid.UUID) -> AsyncIterator[str]:
+    separator = "["
+    async for rows in _row_batches(supplier_orders_query(supplier_id)):
+        yield separator + ",".join(json.dumps(_record(row)) for row in rows)
+        separator = ","
+    yield "[]" if separator == "[" else "]"
+
+
+async def _csv(supplier_id: uuid.UUID) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    async for rows in _row_batches(supplier_orders_query(supplier_id)):
+        writer.writerows(_record(row) for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # Header only: the supplier has no orders
+
+
+_WRITERS = {"ndjson": _ndjson, "json": _json_array, "csv": _csv}
+
+
+def export_supplier_orders(supplier_id: uuid.UUID, format: str) -> StreamingResponse:
+    """
+    Stream every finalized order item of a supplier
+
+    Args:
+        supplier_id: Supplier whose orders are exported
+        format: 'ndjson' (one JSON object per line), 'json' (a JSON array) or 'csv'
+
+    Returns:
+        StreamingResponse: Chunked response, one chunk per batch of rows
+    """
+    headers = {}
+    if format == "csv":
+        headers["Content-Disposition"] = 'attachment; filename="supplier-orders.csv"'
+    return StreamingResponse(_WRITERS[format](supplier_id), media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+
+
+def _overview_record(row: Row) -> dict:
+    return {
+        "order_id": str(row.id),
+        "product_name": row.product_name,
+        "quantity": row.quantity,
+        "vendor_name": row.vendor_name or "Unknown",
+        "finalized_at": row.finalized_at.isoformat() if row.finalized_at else None
+    }
+
+
+async def _status_overview_json(supplier_id: uuid.UUID) -> AsyncIterator[str]:
+    """The overview object; the orders come first, so the summary can count what was streamed."""
+    counts = dict.fromkeys(ORDER_STATUSES, 0)
+    opened = 0  # Status groups opened so far
+
+    def open_groups_through(index: int) -> str:
+        nonlocal opened
+        parts = []
+        while opened <= index:
+            parts.append(("], " if opened else "") + json.dumps(ORDER_STATUSES[opened]) + ": [")
+            opened += 1
+        return "".join(parts)
+
+    yield '{"orders_by_status": {'
+    async for rows in _row_batches(status_overview_query(supplier_id)):
+        parts = []
+        for row in rows:
+            parts.append(open_groups_through(ORDER_STATUSES.index(row.status)))
+            parts.append(("," if counts[row.status] else "") + json.dumps(_overview_record(row)))
+            counts[row.status] += 1
+        yield "".join(parts)
+
+    total_orders = sum(counts.values())
+    yield open_groups_through(len(ORDER_STATUSES) - 1) + "]}, " + json.dumps({
+        "summary": {"total_orders": total_orders, **counts},
+        "message": f"You have {total_orders} total orders to fulfill"
+    })[1:]
+
+
+def stream_supplier_status_overview(supplier_id: uuid.UUID) -> StreamingResponse:
+    """
+    Stream a supplier's order status overview as one JSON object:
+    orders_by_status (status -> orders), summary (counts) and message
+    """
+    return StreamingResponse(_status_overview_json(supplier_id), media_type="application/json")
@@ -0,0 +1,213 @@
+"""
+Helper functions for product listing
+Keyset pagination on (name, id), sparse fieldsets and ranked search shared by the product list endpoints
+"""
+import base64
+import json
+import re
+import uuid
+from typing import List, Optional, Sequence, Tuple
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import select, tuple_, func, literal, literal_column, cast, or_, and_, Float
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from models import Product as ProductModel
+from .schemas import Product as ProductSchema
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Fields a client may ask for with ?fields=
+PRODUCT_FIELDS = tuple(ProductSchema.model_fields)
+
+_product_list_adapter = TypeAdapter(List[ProductSchema])
+
+
+def encode_cursor(*values) -> str:
+    """Opaque cursor pointing just past the row with the given sort-key values"""
+    raw = json.dumps([value if isinstance(value, (int, float)) else str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, types: Sequence[type] = (str, uuid.UUID)) -> list:
+    """
+    Decode a cursor produced by encode_cursor, converting each value with `types`
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(types):
+            raise ValueError("cursor length")
+        return [convert(value) for convert, value in zip(types, values)]
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Parse a comma-separated ?fields= value
+
+    Returns:
+        List of requested field names in request order, or None for all fields
+
+    Raises:
+        HTTPException: 400 for unknown field names
+    """
+    if not fields:
+        return None
+    requested = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in PRODUCT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(PRODUCT_FIELDS)}"
+        )
+    return requested or None
+
+
+def _select_products(fields: Optional[List[str]], *extra) -> Select:
+    if fields is None:
+        return select(ProductModel, *extra)
+    # name and id are always read because cursors are built from them
+    columns = list(dict.fromkeys(fields + ["name", "id"]))
+    return select(*[getattr(ProductModel, column) for column in columns], *extra)
+
+
+def _serialize_products(products: Sequence, fields: Optional[List[str]]) -> bytes:
+    if fields is None:
+        return _product_list_adapter.dump_json(products)
+    return json.dumps(
+        jsonable_encoder([{field: getattr(row, field) for field in fields} for row in products]),
+        separators=(",", ":")
+    ).encode()
+
+
+async def fetch_product_page(
+    db: AsyncSession,
+    filters: Sequence,
+    cursor: Optional[str],
+    limit: int,
+    fields: Optional[List[str]] = None
+) -> Tuple[bytes, Optional[str]]:
+    """
+    Fetch one page of products ordered by (name, id) and serialize it to JSON
+
+    Only the requested columns are selected when `fields` is given; the page is
+    then emitted as plain dicts instead of going through the Product schema.
+
+    Args:
+        db: Database session
+        filters: WHERE clauses for the listing
+        cursor: Cursor from the previous page's X-Next-Cursor header, if any
+        limit: Page size
+        fields: Sparse fieldset from parse_fields, or None for full products
+
+    Returns:
+        tuple: (JSON body, cursor of the next page or None on the last page)
+    """
+    query = _select_products(fields).where(*filters)
+    if cursor:
+        after_name, after_id = decode_cursor(cursor)
+        query = query.where(tuple_(ProductModel.name, ProductModel.id) > tuple_(after_name, after_id))
+    # One extra row tells whether another page exists
+    query = query.order_by(ProductModel.name, ProductModel.id).limit(limit + 1)
+
+    result = await db.execute(query)
+    rows = result.scalars().all() if fields is None else result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].name, rows[-1].id)
+
+    return _serialize_products(rows, fields), next_cursor
+
+
+# --- Search ---
+# The expressions below must stay identical to the ones indexed by the
+# product search migration, or Postgres will not use the indexes.
+
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+
+
+def product_search_vector():
+    """tsvector over name and description (matches ix_products_search_vector)"""
+    return func.to_tsvector(
+        SEARCH_CONFIG,
+        ProductModel.name.op("||")(literal_column("' '")).op("||")(
+            func.coalesce(ProductModel.description, literal_column("''"))
+        )
+    )
+
+
+def prefix_tsquery(query_str: str) -> Optional[str]:
+    """'red oni' -> 'red:* & oni:*', so partially typed words match; None if there are no words"""
+    words = re.findall(r"\w+", query_str.lower())
+    return " & ".join(f"{word}:*" for word in words) if words else None
+
+
+async def search_product_page(
+    db: AsyncSession,
+    query_str: str,
+    cursor: Optional[str],
+    limit: int,
+    fields: Optional[List[str]] = None
+) -> Tuple[bytes, Optional[str]]:
+    """
+    Ranked product search, one page at a time
+
+    A product matches when its name or description contains every typed word
+    as a prefix (full-text), when the name contains the text as a substring,
+    or when the name is close enough to it to forgive a typo (pg_trgm word
+    similarity). Results are ordered by text rank plus name similarity, then
+    by (name, id); the cursor carries all three sort keys.
+
+    Args:
+        db: Database session
+        query_str: What the user typed
+        cursor: Cursor from the previous page's X-Next-Cursor header, if any
+        limit: Page size
+        fields: Sparse fieldset from parse_fields, or None for full products
+
+    Returns:
+        tuple: (JSON body, cursor of the next page or None on the last page)
+    """
+    tsquery_text = prefix_tsquery(query_str)
+    similarity = func.word_similarity(query_str, ProductModel.name)
+    matches = [
+        ProductModel.name.icontains(query_str, autoescape=True),
+        literal(query_str).op("<%")(ProductModel.name)
+    ]
+    rank = similarity
+    if tsquery_text:
+        tsquery = func.to_tsquery(SEARCH_CONFIG, tsquery_text)
+        matches.append(product_search_vector().op("@@")(tsquery))
+        rank = rank + func.ts_rank(product_search_vector(), tsquery)
+    rank = cast(rank, Float).label("rank")
+
+    query = _select_products(fields, rank).where(ProductModel.is_available == True, or_(*matches))
+    if cursor:
+        after_rank, after_name, after_id = decode_cursor(cursor, (float, str, uuid.UUID))
+        query = query.where(or_(
+            rank < after_rank,
+            and_(rank == after_rank, tuple_(ProductModel.name, ProductModel.id) > tuple_(after_name, after_id))
+        ))
+    query = query.order_by(rank.desc(), ProductModel.name, ProductModel.id).limit(limit + 1)
+
+    rows = (await db.execute(query)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.rank, last.name if fields else last[0].name, last.id if fields else last[0].id)
+
+    products = [row[0] for row in rows] if fields is None else rows
+    return _serialize_products(products, fields), next_cursor
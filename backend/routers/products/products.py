@@ -1,33 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from sqlalchemy.orm import selectinload
 import uuid
-from typing import List
+from typing import List, Literal
 from collections import defaultdict
 
 from dependencies.rbac import require_permission
 from dependencies.get_current_user import get_current_user
 from config import get_db
-from models import Product as ProductModel, Deal, CartItem
-from .schemas import ProductCreate, Product as ProductSchema, ProductUpdate, ProductDetail, ProductDashboardView, SupplierOrderItem, SupplierOrderSummary, OrderStatusUpdate
+from models import Product as ProductModel, ProductDemand, Deal, CartItem
+from .cache import CachedJson, catalog_cache, cached_json_response, make_entry
+from .helpers import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, fetch_product_page, search_product_page, parse_fields
+from .suggest import suggest_index
+from .stream import serve_demand_stream
+from .export import export_supplier_orders, stream_supplier_status_overview
+from routers.cart.helpers import lock_vendor_carts, refresh_cart_summaries
+from .schemas import ProductCreate, Product as ProductSchema, ProductSuggestion, ProductUpdate, ProductDetail, ProductDashboardView, SupplierOrderItem, SupplierOrderSummary, OrderStatusUpdate
 
 products_router = APIRouter(prefix="/products", tags=["Products"])
 
+
+def _page_response(body: bytes, next_cursor: str | None) -> Response:
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 # --- Endpoint for All Users (Mainly Vendors) to Browse Products ---
 @products_router.get(
     "/",
     response_model=List[ProductSchema],
     dependencies=[Depends(require_permission(resource="products", permission="read"))]
 )
-async def list_all_products(db: AsyncSession = Depends(get_db)):
+async def list_all_products(
+    request: Request,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: str | None = Query(None, description="Comma-separated subset of product fields, e.g. id,name,base_price,img_emoji"),
+    db: AsyncSession = Depends(get_db)
+):
     """
     Endpoint for vendors to browse all available products from all suppliers.
+    Paginated by name: pass the X-Next-Cursor response header back as `cursor`
+    for the next page. Served from the catalog cache; supports If-None-Match.
     """
-    query = select(ProductModel).where(ProductModel.is_available == True)
-    result = await db.execute(query)
-    products = result.scalars().all()
-    return products
+    selected_fields = parse_fields(fields)
+
+    async def load() -> CachedJson:
+        body, next_cursor = await fetch_product_page(
+            db, [ProductModel.is_available == True], cursor, limit, selected_fields
+        )
+        return make_entry(body, next_cursor)
+
+    cache_key = f"products:list:{cursor or ''}:{limit}:{','.join(selected_fields or [])}"
+    entry = await catalog_cache.get_or_load(cache_key, load)
+    return cached_json_response(request, entry)
 
 # --- Endpoint for All Users (Mainly Vendors) to Search Products ---
 @products_router.get(
@@ -37,20 +64,51 @@ async def list_all_products(db: AsyncSession = Depends(get_db)):
 )
 async def search_products(
     query_str: str,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: str | None = Query(None, description="Comma-separated subset of product fields"),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Endpoint for vendors to search for products by name.
     Example: /products/search?query_str=onion
+    Matches word prefixes in name and description and tolerates small typos;
+    best matches first. Paginated with the X-Next-Cursor header.
     """
-    # Using 'ilike' for case-insensitive search
-    search_query = select(ProductModel).where(
-        ProductModel.name.ilike(f"%{query_str}%"),
-        ProductModel.is_available == True
-    )
-    result = await db.execute(search_query)
-    products = result.scalars().all()
-    return products
+    body, next_cursor = await search_product_page(db, query_str, cursor, limit, parse_fields(fields))
+    return _page_response(body, next_cursor)
+
+# --- Autocomplete (declared before /{product_id} so "suggest" is not taken for an id) ---
+@products_router.get(
+    "/suggest",
+    response_model=List[ProductSuggestion],
+    dependencies=[Depends(require_permission(resource="products", permission="read"))]
+)
+async def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(8, ge=1, le=20)
+):
+    """
+    Endpoint for the search box to suggest products while the vendor types.
+    Served from an in-process prefix index; the database is only read to build it.
+    Example: /products/suggest?q=oni
+    """
+    await suggest_index.ensure_loaded()
+    return suggest_index.suggest(q, limit)
+
+@products_router.websocket("/stream")
+async def stream_product_demand(
+    websocket: WebSocket,
+    product_ids: str | None = Query(None)
+):
+    """
+    WebSocket that pushes live demand and deal unlock/re-lock events.
+    Browsers cannot set headers on a WebSocket, and a token in the URL ends up in
+    access logs, so the client sends {"token": "<access token>"} as its first message.
+    Without product_ids a supplier follows their own products.
+    Example: /products/stream?product_ids=<id>,<id>
+    """
+    await serve_demand_stream(websocket, product_ids)
 
 # --- Endpoints for Suppliers to Manage Their Own Products ---
 
@@ -74,6 +132,8 @@ async def create_product(
     db.add(new_product)
     await db.commit()
     await db.refresh(new_product)
+    await catalog_cache.invalidate()
+    suggest_index.upsert(new_product)
     return new_product
 
 @products_router.get(
@@ -82,15 +142,17 @@ async def create_product(
     dependencies=[Depends(require_permission(resource="products", permission="read"))]
 )
 async def list_my_products(
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: str | None = Query(None, description="Comma-separated subset of product fields"),
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Endpoint for a supplier to list only their own products."""
+    """Endpoint for a supplier to list only their own products, paginated like GET /products/."""
     supplier_id = current_user.get("user_id")
-    query = select(ProductModel).where(ProductModel.supplier_id == uuid.UUID(supplier_id))
-    result = await db.execute(query)
-    my_products = result.scalars().all()
-    return my_products
+    filters = [ProductModel.supplier_id == uuid.UUID(supplier_id)]
+    body, next_cursor = await fetch_product_page(db, filters, cursor, limit, parse_fields(fields))
+    return _page_response(body, next_cursor)
 
 @products_router.put(
     "/{product_id}",
@@ -116,9 +178,20 @@ async def update_product(
     update_data = product_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(product_to_update, key, value)
-    
+
+    if "base_price" in update_data:
+        # Open carts holding this product carry its price in their summaries
+        vendor_ids = (await db.execute(select(CartItem.vendor_id).where(
+            CartItem.product_id == product_id,
+            CartItem.is_finalized == False
+        ).distinct())).scalars().all()
+        await lock_vendor_carts(db, vendor_ids)
+        await refresh_cart_summaries(db, vendor_ids)
+
     await db.commit()
     await db.refresh(product_to_update)
+    await catalog_cache.invalidate()
+    suggest_index.upsert(product_to_update)
     return product_to_update
 
 @products_router.delete(
@@ -141,6 +214,8 @@ async def delete_product(
             raise HTTPException(status_code=403, detail="Not authorized to delete this product.")
         await db.delete(product_to_delete)
         await db.commit()
+        await catalog_cache.invalidate()
+        suggest_index.remove(product_id)
 
 
 @products_router.get(
@@ -150,26 +225,33 @@ async def delete_product(
 )
 async def get_product_details(
     product_id: uuid.UUID,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """
     Endpoint for a vendor to get the detailed view of a single product,
     including all of its available tiered deals.
+    Served from the catalog cache; supports If-None-Match.
     """
-    query = select(ProductModel).options(
-        selectinload(ProductModel.deals) # Eagerly load the related deals
-    ).where(
-        ProductModel.id == product_id,
-        ProductModel.is_available == True
-    )
-    
-    result = await db.execute(query)
-    product = result.scalar_one_or_none()
+    async def load() -> CachedJson | None:
+        query = select(ProductModel).options(
+            selectinload(ProductModel.deals) # Eagerly load the related deals
+        ).where(
+            ProductModel.id == product_id,
+            ProductModel.is_available == True
+        )
 
-    if not product:
+        result = await db.execute(query)
+        product = result.scalar_one_or_none()
+        if not product:
+            return None
+        return make_entry(ProductDetail.model_validate(product).model_dump_json().encode())
+
+    entry = await catalog_cache.get_or_load(f"products:{product_id}", load)
+    if entry is None:
         raise HTTPException(status_code=404, detail="Product not found.")
-        
-    return product
+
+    return cached_json_response(request, entry)
 
 
 @products_router.get(
@@ -187,49 +269,47 @@ async def get_supplier_dashboard(
     """
     supplier_id = uuid.UUID(current_user.get("user_id"))
 
-    # 1. Get all of the supplier's products with their deals
-    products_query = select(ProductModel).options(
-        selectinload(ProductModel.deals)
+    # 1. Current, non-finalized demand per product, from the live demand counters
+    current_demand = func.coalesce(ProductDemand.quantity, 0)
+
+    # 2. One row per product with its demand
+    products_query = select(
+        ProductModel.id, ProductModel.name, ProductModel.unit, current_demand.label("current_demand")
+    ).outerjoin(
+        ProductDemand, ProductDemand.product_id == ProductModel.id
     ).where(ProductModel.supplier_id == supplier_id)
-    
-    my_products = (await db.execute(products_query)).scalars().all()
-    product_ids = [p.id for p in my_products]
+    my_products = (await db.execute(products_query)).all()
 
-    # 2. Calculate the current, non-finalized demand for all these products
-    demand_query = select(CartItem.product_id, CartItem.quantity).where(
-        CartItem.product_id.in_(product_ids),
-        CartItem.is_finalized == False
-    )
-    demand_results = (await db.execute(demand_query)).all()
-
-    # Use a defaultdict to easily sum up the demand
-    current_demand = defaultdict(int)
-    for product_id, quantity in demand_results:
-        current_demand[product_id] += quantity
-
-    # 3. Build the detailed response for the dashboard
-    dashboard_data = []
-    for product in my_products:
-        demand = current_demand[product.id]
-        
-        deals_status = []
-        if product.deals:
-            for deal in sorted(product.deals, key=lambda d: d.threshold):
-                deals_status.append({
-                    "threshold": deal.threshold,
-                    "discount": deal.discount,
-                    "is_unlocked": demand >= deal.threshold
-                })
-
-        dashboard_data.append({
+    # 3. One row per deal, with the unlock check done against the same aggregate
+    deals_query = select(
+        Deal.product_id, Deal.threshold, Deal.discount, (current_demand >= Deal.threshold).label("is_unlocked")
+    ).join(
+        ProductModel, Deal.product_id == ProductModel.id
+    ).outerjoin(
+        ProductDemand, ProductDemand.product_id == Deal.product_id
+    ).where(
+        ProductModel.supplier_id == supplier_id
+    ).order_by(Deal.product_id, Deal.threshold)
+
+    deals_by_product = defaultdict(list)
+    for deal in (await db.execute(deals_query)).all():
+        deals_by_product[deal.product_id].append({
+            "threshold": deal.threshold,
+            "discount": deal.discount,
+            "is_unlocked": deal.is_unlocked
+        })
+
+    # 4. Build the detailed response for the dashboard
+    return [
+        {
             "id": product.id,
             "name": product.name,
             "unit": product.unit,
-            "current_demand": demand,
-            "deals_status": deals_status
-        })
-
-    return dashboard_data
+            "current_demand": product.current_demand,
+            "deals_status": deals_by_product[product.id]
+        }
+        for product in my_products
+    ]
 
 
 @products_router.get(
@@ -247,41 +327,25 @@ async def get_supplier_pending_orders(
     """
     supplier_id = uuid.UUID(current_user.get("user_id"))
 
-    # Get all finalized cart items for this supplier's products
-    query = select(CartItem).options(
-        selectinload(CartItem.product)
+    # One row per product, aggregated in the database
+    query = select(
+        CartItem.product_id,
+        ProductModel.name.label("product_name"),
+        ProductModel.unit,
+        func.sum(CartItem.quantity).label("total_quantity"),
+        func.count(CartItem.id).label("total_orders"),
+        func.sum(func.coalesce(CartItem.final_price, 0) * CartItem.quantity).label("estimated_revenue")
     ).join(
         ProductModel, CartItem.product_id == ProductModel.id
     ).where(
         ProductModel.supplier_id == supplier_id,
         CartItem.is_finalized == True
-    )
+    ).group_by(
+        CartItem.product_id, ProductModel.name, ProductModel.unit
+    ).order_by(ProductModel.name)
 
     result = await db.execute(query)
-    cart_items = result.scalars().all()
-
-    # Aggregate the data manually
-    product_summaries = defaultdict(lambda: {
-        'product_id': None,
-        'product_name': '',
-        'unit': '',
-        'total_quantity': 0,
-        'total_orders': 0,
-        'estimated_revenue': 0.0
-    })
-
-    for item in cart_items:
-        product_id = item.product_id
-        if product_summaries[product_id]['product_id'] is None:
-            product_summaries[product_id]['product_id'] = product_id
-            product_summaries[product_id]['product_name'] = item.product.name
-            product_summaries[product_id]['unit'] = item.product.unit
-        
-        product_summaries[product_id]['total_quantity'] += item.quantity
-        product_summaries[product_id]['total_orders'] += 1
-        product_summaries[product_id]['estimated_revenue'] += float(item.final_price or 0) * item.quantity
-
-    return list(product_summaries.values())
+    return result.mappings().all()
 
 
 @products_router.get(
@@ -329,6 +393,23 @@ async def get_supplier_order_details(
     return order_details
 
 
+@products_router.get(
+    "/me/orders/export",
+    dependencies=[Depends(require_permission(resource="products", permission="read"))]
+)
+async def export_supplier_order_details(
+    format: Literal["ndjson", "json", "csv"] = Query("ndjson"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Endpoint for a supplier to export every order item they need to fulfill, streamed.
+    Same rows as /me/orders/details, as NDJSON (default), a JSON array or CSV for offline reconciliation.
+    Example: /products/me/orders/export?format=csv
+    """
+    supplier_id = uuid.UUID(current_user.get("user_id"))
+    return export_supplier_orders(supplier_id, format)
+
+
 @products_router.put(
     "/orders/{product_id}/status",
     dependencies=[Depends(require_permission(resource="products", permission="write"))]
@@ -406,69 +487,11 @@ async def update_product_order_status(
     dependencies=[Depends(require_permission(resource="products", permission="read"))]
 )
 async def get_supplier_orders_status_overview(
-    current_user: dict = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    current_user: dict = Depends(get_current_user)
 ):
     """
     Endpoint for suppliers to get an overview of order preparation status across all their products.
+    Streamed from a server-side cursor, so memory stays flat however many orders there are.
     """
     supplier_id = uuid.UUID(current_user.get("user_id"))
-
-    # Get all finalized orders for this supplier's products
-    query = select(CartItem).options(
-        selectinload(CartItem.product),
-        selectinload(CartItem.vendor)
-    ).join(
-        ProductModel, CartItem.product_id == ProductModel.id
-    ).where(
-        ProductModel.supplier_id == supplier_id,
-        CartItem.is_finalized == True
-    ).order_by(CartItem.finalized_at.desc())
-
-    result = await db.execute(query)
-    cart_items = result.scalars().all()
-
-    # Group orders by status (simulated since we don't have a real status table yet)
-    status_overview = {
-        "received": [],
-        "preparing": [],
-        "ready_for_pickup": [],
-        "picked_up": []
-    }
-    
-    # For demo purposes, we'll assign random statuses
-    # In production, this would come from the actual order status tracking
-    for i, item in enumerate(cart_items):
-        # Simulate different statuses based on order age
-        if i % 4 == 0:
-            status = "picked_up"
-        elif i % 4 == 1:
-            status = "ready_for_pickup"
-        elif i % 4 == 2:
-            status = "preparing"
-        else:
-            status = "received"
-            
-        status_overview[status].append({
-            "order_id": item.id,
-            "product_name": item.product.name,
-            "quantity": item.quantity,
-            "vendor_name": item.vendor.full_name if item.vendor else "Unknown",
-            "finalized_at": item.finalized_at.isoformat() if item.finalized_at else None
-        })
-
-    # Calculate summary statistics
-    total_orders = len(cart_items)
-    summary = {
-        "total_orders": total_orders,
-        "received": len(status_overview["received"]),
-        "preparing": len(status_overview["preparing"]),
-        "ready_for_pickup": len(status_overview["ready_for_pickup"]),
-        "picked_up": len(status_overview["picked_up"])
-    }
-
-    return {
-        "summary": summary,
-        "orders_by_status": status_overview,
-        "message": f"You have {total_orders} total orders to fulfill"
-    }
\ No newline at end of file
+    return stream_supplier_status_overview(supplier_id)
\ No newline at end of file
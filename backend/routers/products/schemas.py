@@ -22,6 +22,13 @@ class Product(ProductBase):
         from_attributes = True  # Updated for Pydantic v2
 
 
+class ProductSuggestion(BaseModel):
+    """Autocomplete entry for the product search box."""
+    id: uuid.UUID
+    name: str
+    img_emoji: str | None = None
+
+
 class ProductUpdate(BaseModel):
     name: str | None = None
     description: str | None = None
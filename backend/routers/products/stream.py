@@ -0,0 +1,166 @@
+"""
+Live demand stream for products
+Pushes collective-demand changes and deal unlocks to WebSocket clients, so
+dashboards and product pages no longer have to poll for them.
+
+Cart mutations call publish_demand_change after committing. Events are fanned
+out in this process through utils/pubsub.py; each connection has a bounded
+queue and is told with an 'overflow' event when it fell behind and lost events.
+Every demand event carries the absolute demand, so the next one brings the
+client back in step.
+
+The access token is not part of the URL (URLs end up in server and proxy
+logs): the client's first message must be {"token": "<access token>"}, sent
+within STREAM_AUTH_TIMEOUT seconds, or the connection is closed.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from typing import Dict, List, Optional
+from fastapi import WebSocket, WebSocketDisconnect, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import AsyncSessionLocal
+from dependencies.get_current_user import authenticate_token
+from dependencies.rbac import has_permission
+from models import Product as ProductModel, ProductDemand, Deal
+from utils.pubsub import PubSub, Subscription
+
+logger = logging.getLogger(__name__)
+
+STREAM_MAX_PRODUCTS = int(os.environ.get("STREAM_MAX_PRODUCTS", "200"))
+STREAM_AUTH_TIMEOUT = float(os.environ.get("STREAM_AUTH_TIMEOUT", "10"))
+
+# Topics are product ids
+demand_events = PubSub()
+
+
+def _demand_event(product_id: uuid.UUID, demand: int, delta: int) -> dict:
+    return {"type": "demand", "product_id": str(product_id), "demand": demand, "delta": delta}
+
+
+async def publish_demand_change(db: AsyncSession, product_id: uuid.UUID, demand: int, delta: int) -> None:
+    """
+    Publish a committed demand change, plus an unlock (or re-lock) event for
+    every deal threshold it crossed. Does nothing when nobody is listening.
+
+    Args:
+        db: Database session, used only to look up the crossed deals
+        product_id: Product whose demand changed
+        demand: Demand after the change
+        delta: Size of the change (negative when demand dropped)
+    """
+    if not delta or not demand_events.has_subscribers(product_id):
+        return
+
+    demand_events.publish(product_id, _demand_event(product_id, demand, delta))
+
+    low, high = sorted((demand - delta, demand))
+    query = select(Deal.threshold, Deal.discount).where(
+        Deal.product_id == product_id,
+        Deal.threshold > low,
+        Deal.threshold <= high
+    ).order_by(Deal.threshold if delta > 0 else Deal.threshold.desc())
+
+    for threshold, discount in (await db.execute(query)).all():
+        demand_events.publish(product_id, {
+            "type": "deal_unlocked" if delta > 0 else "deal_locked",
+            "product_id": str(product_id),
+            "threshold": threshold,
+            "discount": float(discount)
+        })
+
+
+def _parse_product_ids(product_ids: str) -> List[uuid.UUID]:
+    try:
+        parsed = list(dict.fromkeys(uuid.UUID(value.strip()) for value in product_ids.split(",") if value.strip()))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid product id.")
+    if len(parsed) > STREAM_MAX_PRODUCTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {STREAM_MAX_PRODUCTS} products can be followed per connection."
+        )
+    return parsed
+
+
+async def _initial_state(product_ids: Optional[List[uuid.UUID]], supplier_id: uuid.UUID) -> Dict[uuid.UUID, int]:
+    """Current demand of the followed products (a supplier's own products when none are given)."""
+    async with AsyncSessionLocal() as db:
+        query = select(ProductModel.id, ProductDemand.quantity).outerjoin(
+            ProductDemand, ProductDemand.product_id == ProductModel.id
+        )
+        if product_ids is None:
+            query = query.where(ProductModel.supplier_id == supplier_id).limit(STREAM_MAX_PRODUCTS)
+        else:
+            query = query.where(ProductModel.id.in_(product_ids))
+        return {product_id: quantity or 0 for product_id, quantity in (await db.execute(query)).all()}
+
+
+async def _forward_events(websocket: WebSocket, subscription: Subscription):
+    while True:
+        event = await subscription.get()
+        if subscription.dropped:
+            await websocket.send_json({"type": "overflow", "dropped": subscription.dropped})
+            subscription.dropped = 0
+        await websocket.send_json(event)
+
+
+async def _wait_for_disconnect(websocket: WebSocket):
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass  # Clients have nothing to say; anything they send is ignored
+
+
+async def _receive_token(websocket: WebSocket) -> str:
+    """Read the access token from the client's first message."""
+    try:
+        message = await asyncio.wait_for(websocket.receive_json(), STREAM_AUTH_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication timed out.")
+    except (ValueError, KeyError):  # Not JSON, or a binary frame
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Expected a JSON authentication message.")
+    token = message.get("token") if isinstance(message, dict) else None
+    if not isinstance(token, str) or not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication message must contain a token.")
+    return token
+
+
+async def serve_demand_stream(websocket: WebSocket, product_ids: Optional[str]):
+    """
+    Authenticate a WebSocket client from its first message, send the current
+    demand of the products it follows, then stream their changes until it
+    disconnects.
+    """
+    await websocket.accept()
+    try:
+        followed = _parse_product_ids(product_ids) if product_ids else None
+        current_user = await authenticate_token(await _receive_token(websocket))
+        if not has_permission(current_user.get("role", "user"), "products", "read"):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied.")
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+    except WebSocketDisconnect:
+        return
+
+    demand = await _initial_state(followed, uuid.UUID(current_user["user_id"]))
+
+    with demand_events.subscribe(followed or demand.keys()) as subscription:
+        for product_id, quantity in demand.items():
+            await websocket.send_json(_demand_event(product_id, quantity, 0))
+
+        tasks = [
+            asyncio.create_task(_forward_events(websocket, subscription)),
+            asyncio.create_task(_wait_for_disconnect(websocket))
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error is not None and not isinstance(error, WebSocketDisconnect):
+                    logger.warning(f"Demand stream closed on error: {error}")
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,156 @@
+"""
+In-process autocomplete index for product names
+Backs GET /products/suggest without touching the database on the hot path.
+
+The index is two sorted lists of (key, product_id) tuples searched with bisect:
+one of full normalized names, one of the later word-suffixes of each name
+("red onion 5kg" -> "onion 5kg", "5kg"), so typing any word of a name finds
+it while whole-name matches still rank first. Product mutations in this
+process update the index in place; it is also rebuilt in the background every
+SUGGEST_INDEX_REFRESH_SECONDS so changes made by other workers show up.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+import uuid
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from config import AsyncSessionLocal
+from models import Product as ProductModel
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_INDEX_REFRESH = float(os.environ.get("SUGGEST_INDEX_REFRESH_SECONDS", "300"))
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.casefold()))
+
+
+def _keys_for(name: str) -> Tuple[str, List[str]]:
+    """(full-name key, word-suffix keys)"""
+    words = normalize(name).split(" ")
+    return " ".join(words), [" ".join(words[i:]) for i in range(1, len(words))]
+
+
+def _remove_entry(entries: List[Tuple[str, str]], entry: Tuple[str, str]):
+    position = bisect_left(entries, entry)
+    if position < len(entries) and entries[position] == entry:
+        del entries[position]
+
+
+def _collect(entries: List[Tuple[str, str]], prefix: str, limit: int, seen: set) -> List[str]:
+    found = []
+    position = bisect_left(entries, (prefix,))
+    while position < len(entries) and len(found) < limit:
+        key, product_id = entries[position]
+        if not key.startswith(prefix):
+            break
+        if product_id not in seen:
+            seen.add(product_id)
+            found.append(product_id)
+        position += 1
+    return found
+
+
+class SuggestIndex:
+    """Sorted-array prefix index over available product names."""
+
+    def __init__(self):
+        self._names: List[Tuple[str, str]] = []  # (full-name key, product id), sorted
+        self._words: List[Tuple[str, str]] = []  # (word-suffix key, product id), sorted
+        self._products: Dict[str, dict] = {}  # product id -> suggestion payload
+        self._loaded_at: Optional[float] = None
+        self._load_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    # --- Maintenance ---
+
+    def _build(self, products: List[dict]):
+        names, words = [], []
+        for product in products:
+            name_key, word_keys = _keys_for(product["name"])
+            names.append((name_key, product["id"]))
+            words.extend((key, product["id"]) for key in word_keys)
+        names.sort()
+        words.sort()
+        self._names, self._words = names, words
+        self._products = {product["id"]: product for product in products}
+        self._loaded_at = time.monotonic()
+
+    async def _load(self):
+        async with AsyncSessionLocal() as db:
+            query = select(ProductModel.id, ProductModel.name, ProductModel.img_emoji).where(
+                ProductModel.is_available == True
+            )
+            rows = (await db.execute(query)).all()
+        self._build([{"id": str(row.id), "name": row.name, "img_emoji": row.img_emoji} for row in rows])
+        logger.info(f"Suggest index built: {len(rows)} products, {len(self._names) + len(self._words)} keys")
+
+    async def ensure_loaded(self):
+        """Load on first use; afterwards refresh in the background once the index is old."""
+        if self._loaded_at is None:
+            async with self._load_lock:
+                if self._loaded_at is None:
+                    await self._load()
+        elif time.monotonic() - self._loaded_at > SUGGEST_INDEX_REFRESH and not self._refresh_task:
+            self._refresh_task = asyncio.create_task(self._refresh())
+
+    async def _refresh(self):
+        try:
+            async with self._load_lock:
+                await self._load()
+        except Exception as e:
+            logger.warning(f"Suggest index refresh failed, keeping the current index: {e}")
+            self._loaded_at = time.monotonic()  # Retry after another refresh interval
+        finally:
+            self._refresh_task = None
+
+    def remove(self, product_id: uuid.UUID):
+        product = self._products.pop(str(product_id), None)
+        if product is None:
+            return
+        name_key, word_keys = _keys_for(product["name"])
+        _remove_entry(self._names, (name_key, product["id"]))
+        for key in word_keys:
+            _remove_entry(self._words, (key, product["id"]))
+
+    def upsert(self, product: ProductModel):
+        """Reflect a created or updated product; unavailable products are dropped."""
+        if self._loaded_at is None:
+            return  # Nothing to patch yet; the first load reads the database
+        self.remove(product.id)
+        if not product.is_available:
+            return
+        payload = {"id": str(product.id), "name": product.name, "img_emoji": product.img_emoji}
+        self._products[payload["id"]] = payload
+        name_key, word_keys = _keys_for(product.name)
+        insort(self._names, (name_key, payload["id"]))
+        for key in word_keys:
+            insort(self._words, (key, payload["id"]))
+
+    # --- Lookup ---
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[dict]:
+        """
+        Products with a name (or a word of the name) starting with `prefix`.
+
+        Whole-name matches come first, then word matches; each group is alphabetical.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        seen = set()
+        product_ids = _collect(self._names, prefix, limit, seen)
+        if len(product_ids) < limit:
+            product_ids += _collect(self._words, prefix, limit - len(product_ids), seen)
+        return [self._products[product_id] for product_id in product_ids]
+
+
+suggest_index = SuggestIndex()
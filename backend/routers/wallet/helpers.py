@@ -0,0 +1,147 @@
+"""
+Helper functions for wallet operations
+Contains balance mutations shared by the wallet routes and the nightly finalization job
+
+Every balance change is an insert into the wallet_transactions ledger. The
+per-user wallet_balances row is adjusted by the same statement, so reads stay
+a single primary-key lookup and writers never lock the profiles row.
+"""
+import logging
+import uuid
+from decimal import Decimal
+from typing import Dict, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, values, column, literal, func, Numeric
+from sqlalchemy.dialects.postgresql import UUID, insert as pg_insert
+from sqlalchemy.engine import Row
+
+from models import Profile, WalletTransaction, WalletBalance
+
+logger = logging.getLogger(__name__)
+
+
+async def get_wallet_balance(db: AsyncSession, user_id: uuid.UUID) -> Decimal:
+    """Read a user's current balance from the wallet_balances snapshot."""
+    query = select(WalletBalance.balance).where(WalletBalance.user_id == user_id)
+    balance = (await db.execute(query)).scalar_one_or_none()
+    return balance or Decimal("0")
+
+
+async def credit_wallet(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    amount: Decimal,
+    kind: str,
+    reference: str
+) -> Decimal:
+    """
+    Credit a wallet: append a ledger entry and add it to the balance in one statement.
+
+    A (user_id, kind, reference) that was already recorded is ignored, so
+    replaying the same top-up does not credit it twice.
+
+    Args:
+        db: Database session
+        user_id: Wallet owner
+        amount: Positive amount to credit
+        kind: Ledger entry kind, e.g. 'topup'
+        reference: External reference that identifies the credit
+
+    Returns:
+        Decimal: The balance after the credit
+    """
+    ledger = pg_insert(WalletTransaction).values(
+        id=uuid.uuid4(),
+        user_id=user_id,
+        amount=amount,
+        kind=kind,
+        reference=reference
+    ).on_conflict_do_nothing(
+        constraint="uq_wallet_transactions_user_kind_reference"
+    ).returning(WalletTransaction.user_id, WalletTransaction.amount).cte("ledger")
+
+    upsert = pg_insert(WalletBalance).from_select(
+        ["user_id", "balance"],
+        select(ledger.c.user_id, ledger.c.amount)
+    )
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[WalletBalance.user_id],
+        set_={
+            "balance": WalletBalance.balance + upsert.excluded.balance,
+            "updated_at": func.now()
+        }
+    ).returning(WalletBalance.balance)
+
+    new_balance = (await db.execute(upsert)).scalar_one_or_none()
+    if new_balance is None:
+        logger.info(f"Ignoring duplicate wallet credit {kind}/{reference} for user {user_id}")
+        return await get_wallet_balance(db, user_id)
+    return new_balance
+
+
+async def debit_wallets(
+    db: AsyncSession,
+    amounts: Dict[uuid.UUID, Decimal],
+    kind: str,
+    reference: str
+) -> List[Row]:
+    """
+    Debit many wallets in a single statement.
+
+    Runs one UPDATE wallet_balances ... FROM (VALUES ...) that only touches
+    wallets holding at least the requested amount, so the balance check and the
+    debit happen atomically under the row lock. The same statement appends a
+    ledger entry for every wallet it debited. Wallets with insufficient funds
+    are left as-is, and so are wallets that already have a (kind, reference)
+    ledger entry: replaying a debit touches neither the balance nor the ledger.
+
+    Args:
+        db: Database session
+        amounts: Amount to debit per user id
+        kind: Ledger entry kind, e.g. 'order_debit'
+        reference: Reference shared by all entries, e.g. the finalization run id
+
+    Returns:
+        List: (id, phone, full_name) rows of the wallets that were debited
+    """
+    if not amounts:
+        return []
+
+    debits = values(
+        column("user_id", UUID(as_uuid=True)),
+        column("amount", Numeric(10, 2)),
+        name="debits"
+    ).data(list(amounts.items()))
+
+    already_debited = select(WalletTransaction.id).where(
+        WalletTransaction.user_id == debits.c.user_id,
+        WalletTransaction.kind == kind,
+        WalletTransaction.reference == reference
+    ).exists()
+
+    debited = update(WalletBalance).where(
+        WalletBalance.user_id == debits.c.user_id,
+        WalletBalance.balance >= debits.c.amount,
+        ~already_debited
+    ).values(
+        balance=WalletBalance.balance - debits.c.amount,
+        updated_at=func.now()
+    ).returning(WalletBalance.user_id, debits.c.amount).cte("debited")
+
+    ledger = pg_insert(WalletTransaction).from_select(
+        ["id", "user_id", "amount", "kind", "reference"],
+        select(
+            func.gen_random_uuid(),
+            debited.c.user_id,
+            -debited.c.amount,
+            literal(kind),
+            literal(reference)
+        )
+    ).cte("ledger")
+
+    query = select(Profile.id, Profile.phone, Profile.full_name).join(
+        debited, debited.c.user_id == Profile.id
+    ).add_cte(ledger)
+
+    result = await db.execute(query)
+    return list(result.all())
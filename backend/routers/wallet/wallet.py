@@ -1,11 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 import uuid
+from decimal import Decimal
 
 from dependencies.get_current_user import get_current_user
 from config import get_db
-from models import Profile
+from .helpers import get_wallet_balance, credit_wallet
 # Import the new schemas
 from .schemas import WalletStatus, RazorpayOrderCreate, RazorpayOrderResponse, RazorpayVerification
 
@@ -17,12 +17,11 @@ async def get_my_wallet_balance(
     db: AsyncSession = Depends(get_db)
 ):
     """Endpoint for a user to check their wallet balance."""
-    user_id = current_user.get("user_id")
+    user_id = uuid.UUID(current_user.get("user_id"))
     
-    profile_query = select(Profile.wallet_balance).where(Profile.id == user_id)
-    balance = (await db.execute(profile_query)).scalar_one_or_none()
+    balance = await get_wallet_balance(db, user_id)
     
-    return {"current_balance": float(balance or 0)}
+    return {"current_balance": float(balance)}
 
 # --- NEW: Endpoints for Razorpay Mock Flow ---
 
@@ -55,16 +54,18 @@ async def verify_razorpay_payment(
     Mock endpoint to verify a Razorpay payment and add funds to the wallet.
     In a real app, this would involve cryptographic signature verification.
     """
-    user_id = current_user.get("user_id")
+    user_id = uuid.UUID(current_user.get("user_id"))
 
     # In a real app, you would verify the signature here.
     # For the hackathon, we trust the data and add the funds.
-    
-    profile_query = select(Profile).where(Profile.id == user_id)
-    profile = (await db.execute(profile_query)).scalar_one()
-
-    profile.wallet_balance = (profile.wallet_balance or 0) + verification_data.amount
+    # The payment id makes the credit idempotent if the client retries.
+    new_balance = await credit_wallet(
+        db,
+        user_id,
+        Decimal(str(verification_data.amount)),
+        kind="topup",
+        reference=verification_data.razorpay_payment_id
+    )
     await db.commit()
-    await db.refresh(profile)
     
-    return {"current_balance": float(profile.wallet_balance)}
\ No newline at end of file
+    return {"current_balance": float(new_balance)}
\ No newline at end of file
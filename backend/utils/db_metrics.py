@@ -0,0 +1,106 @@
+# ==============================================================================
+# File: utils/db_metrics.py (Connection Hold-Time Metrics)
+# ==============================================================================
+# Measures how long each request keeps pooled database connections checked out.
+#
+#   - install_pool_metrics(engine) hooks the pool's checkout/checkin events.
+#   - DbTimingMiddleware gives every HTTP request its own counter and reports it
+#     in a `Server-Timing: db;dur=<ms>;desc="<n> checkouts"` response header.
+#   - pool_metrics() returns process-wide totals; add_hold_observer() passes every
+#     checkout-to-checkin hold time to a callback (utils/metrics.py histograms).
+import contextvars
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RequestDbStats:
+    checkouts: int = 0
+    held_seconds: float = 0.0
+    open_since: Dict[int, float] = field(default_factory=dict)  # Connections still checked out
+
+    def total_held(self) -> float:
+        now = time.perf_counter()
+        return self.held_seconds + sum(now - started for started in self.open_since.values())
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestDbStats]] = contextvars.ContextVar("request_db_stats", default=None)
+_totals = {"checkouts": 0, "held_seconds": 0.0}
+_hold_observers: List[Callable[[float], None]] = []
+
+
+def add_hold_observer(observer: Callable[[float], None]) -> None:
+    """Call observer(seconds) with the hold time of every connection returned to the pool."""
+    _hold_observers.append(observer)
+
+
+def install_pool_metrics(engine) -> None:
+    """Attach checkout/checkin listeners to an (async) engine's pool."""
+    pool = getattr(engine, "sync_engine", engine).pool
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        started = time.perf_counter()
+        # Remember whose request took the connection; checkin may run in another context
+        stats = _request_stats.get()
+        connection_record.info["checked_out_at"] = started
+        connection_record.info["request_stats"] = stats
+        if stats is not None:
+            stats.checkouts += 1
+            stats.open_since[id(connection_record)] = started
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        stats = connection_record.info.pop("request_stats", None)
+        if started is None:
+            return
+        held = time.perf_counter() - started
+        _totals["checkouts"] += 1
+        _totals["held_seconds"] += held
+        for observer in _hold_observers:
+            observer(held)
+        if stats is not None:
+            stats.held_seconds += held
+            stats.open_since.pop(id(connection_record), None)
+
+
+def pool_metrics() -> Dict[str, float]:
+    """Process-wide checkout count and total connection hold time since start."""
+    return dict(_totals)
+
+
+class DbTimingMiddleware:
+    """Pure ASGI middleware that reports per-request connection hold time in Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestDbStats()
+        token = _request_stats.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                held_ms = stats.total_held() * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", f'db;dur={held_ms:.1f};desc="{stats.checkouts} checkouts"'.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            if stats.checkouts:
+                logger.debug(f"{scope['method']} {scope['path']}: {stats.checkouts} DB checkouts, held {stats.total_held() * 1000:.1f} ms")
@@ -0,0 +1,229 @@
+# ==============================================================================
+# File: utils/metrics.py (Request and Database Metrics)
+# ==============================================================================
+# In-process Prometheus metrics, rendered in the text exposition format by
+# render_metrics() for the /metrics endpoint.
+#
+#   - MetricsMiddleware (pure ASGI) times every HTTP request and labels it with
+#     the matched route template, so /products/{product_id} is one series.
+#   - install_sql_metrics(engine) counts SQL statements and their execution time
+#     (cursor execute events) and records how long connections stay checked
+#     out, from the pool checkin hook of utils/db_metrics.py. Statement counts
+#     and DB time are also recorded per request and per route: a route whose
+#     statements-per-request histogram sits high is doing N+1 queries; long
+#     hold times with checked_out at the pool size mean the pool is starved.
+#
+# Metrics are per worker process; Prometheus aggregates across workers.
+import contextvars
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+from utils.db_metrics import add_hold_observer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+POOL_HOLD_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help_text = name, help_text
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name, self.help_text = name, help_text
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series: Dict[Labels, List[float]] = {}  # bucket counts..., sum, count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[position] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    bucket_labels = labels + (("le", _format_value(bound)),)
+                    lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {_format_value(cumulative)}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(series[-1])}")
+        return lines
+
+
+# --- Metrics ---
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", LATENCY_BUCKETS
+)
+http_requests = Counter("http_requests_total", "HTTP requests by route template and status code.")
+db_statements_per_request = Histogram(
+    "db_statements_per_request", "SQL statements executed per HTTP request, by route template.", STATEMENT_BUCKETS
+)
+db_time_per_request = Histogram(
+    "db_time_per_request_seconds", "Time spent executing SQL per HTTP request, by route template.", LATENCY_BUCKETS
+)
+db_statements = Counter("db_statements_total", "SQL statements executed.")
+db_statement_seconds = Counter("db_statement_seconds_total", "Time spent executing SQL statements.")
+db_pool_connection_hold = Histogram(
+    "db_pool_connection_hold_seconds", "Time connections stay checked out of the pool, checkout to checkin.",
+    POOL_HOLD_BUCKETS
+)
+
+# Fed by the checkin listener of utils/db_metrics.py
+add_hold_observer(db_pool_connection_hold.observe)
+
+_METRICS = (
+    http_request_duration, http_requests, db_statements_per_request, db_time_per_request,
+    db_statements, db_statement_seconds, db_pool_connection_hold
+)
+
+
+@dataclass
+class RequestSqlStats:
+    statements: int = 0
+    seconds: float = 0.0
+
+
+_request_sql: contextvars.ContextVar[Optional[RequestSqlStats]] = contextvars.ContextVar("request_sql_stats", default=None)
+_pools = []
+
+
+def install_sql_metrics(engine) -> None:
+    """
+    Count statements and time them via cursor events on an (async) engine, and
+    record connection hold times. Pool hold times come from the checkin listener
+    of install_pool_metrics, which must be installed on the same engine.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        db_statements.inc()
+        db_statement_seconds.inc(elapsed)
+        stats = _request_sql.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.seconds += elapsed
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(context):
+        # after_cursor_execute does not run for failed statements
+        if context.connection is not None and context.connection.info.get("query_started_at"):
+            context.connection.info["query_started_at"].pop()
+
+    _pools.append(sync_engine.pool)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency and SQL usage per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestSqlStats()
+        token = _request_sql.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_sql.reset(token)
+            # The router stores the matched route in the scope; unmatched paths share one series
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            http_request_duration.observe(elapsed, method=method, route=route)
+            http_requests.inc(method=method, route=route, status=str(status_code))
+            db_statements_per_request.observe(stats.statements, method=method, route=route)
+            db_time_per_request.observe(stats.seconds, method=method, route=route)
+
+
+def _pool_lines() -> List[str]:
+    # Checkout count and total hold time are the _count and _sum of db_pool_connection_hold_seconds
+    lines = []
+    for name, help_text, read in (
+        ("db_pool_size", "Configured pool size.", lambda pool: pool.size()),
+        ("db_pool_checked_out", "Connections currently checked out.", lambda pool: pool.checkedout()),
+        ("db_pool_overflow", "Connections open beyond the pool size.", lambda pool: max(pool.overflow(), 0)),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [f"{name} {_format_value(read(pool))}" for pool in _pools if hasattr(pool, "checkedout")]
+    return lines
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _METRICS:
+        lines += metric.render()
+    if _pools:
+        lines += _pool_lines()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,117 @@
+# ==============================================================================
+# File: utils/notification_dispatcher.py (Async SMS Delivery)
+# ==============================================================================
+import abc
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# --- Transports: how a message actually leaves the building ---
+
+class SmsTransport(abc.ABC):
+    """Base class for SMS transports. Subclasses deliver one message and report success."""
+
+    @abc.abstractmethod
+    async def send(self, to: str, body: str) -> bool:
+        ...
+
+
+class TwilioTransport(SmsTransport):
+    """Sends through Twilio. The blocking HTTP call runs in a worker thread, off the event loop."""
+
+    def __init__(self, client, from_number: str, override_to: Optional[str] = None):
+        self.client = client
+        self.from_number = from_number
+        self.override_to = override_to  # Demo mode: deliver everything to one number
+
+    async def send(self, to: str, body: str) -> bool:
+        recipient = self.override_to or to
+        try:
+            message = await asyncio.to_thread(
+                self.client.messages.create, to=recipient, from_=self.from_number, body=body
+            )
+            logger.info(f"SMS sent successfully to {recipient}. SID: {message.sid}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to send SMS to {recipient}: {e}")
+            return False
+
+
+class ConsoleTransport(SmsTransport):
+    """Mock transport used when Twilio is not configured: prints the message instead."""
+
+    async def send(self, to: str, body: str) -> bool:
+        print("--- TWILIO NOT CONFIGURED - MOCK SMS ---")
+        print(f"TO: {to}")
+        print(f"MESSAGE: {body}")
+        print("--------------------------------------")
+        return True  # Printing is all the mock can do, so count it as delivered
+
+
+class RecordingTransport(SmsTransport):
+    """In-memory transport for tests and local runs: records every message it is given."""
+
+    def __init__(self):
+        self.sent: List[tuple] = []
+
+    async def send(self, to: str, body: str) -> bool:
+        self.sent.append((to, body))
+        return True
+
+
+# --- Rate limiting ---
+
+class RateLimiter:
+    """Token bucket shared by every send of a dispatcher."""
+
+    def __init__(self, rate_per_second: float, burst: int = 1):
+        self.rate = rate_per_second
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return  # Unlimited
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# --- Dispatcher ---
+
+class NotificationDispatcher:
+    """
+    Throttled access to an SMS transport.
+
+    send() delivers one message through the transport, with at most
+    `concurrency` sends in flight and all of them paced by a shared rate
+    limiter. The outbox worker (utils/outbox_worker.py) sends through here.
+    """
+
+    def __init__(self, transport: SmsTransport, concurrency: int = 4, rate_per_second: float = 10.0):
+        self.transport = transport
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(rate_per_second, burst=concurrency)
+        self._slots = asyncio.Semaphore(concurrency)
+
+    def set_transport(self, transport: SmsTransport):
+        """Swap the transport, e.g. for a RecordingTransport in tests."""
+        self.transport = transport
+
+    async def send(self, to: str, body: str) -> bool:
+        """Deliver one message, waiting for a free slot and the rate limiter. Returns the transport's result."""
+        async with self._slots:
+            await self.rate_limiter.acquire()
+            return await self.transport.send(to, body)
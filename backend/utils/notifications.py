@@ -2,9 +2,15 @@
 # File: utils/notifications.py (Enhanced Multi-Directional Notification System)
 # ==============================================================================
 import os
+import uuid
 import logging
+from typing import List, Tuple
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
+from utils.notification_dispatcher import NotificationDispatcher, TwilioTransport, ConsoleTransport
+from models import NotificationOutbox
 
 logger = logging.getLogger(__name__)
 
@@ -25,126 +31,106 @@ except Exception as e:
     logger.error(f"Failed to initialize Twilio client: {e}")
     twilio_client = None
 
+# Demo override: every SMS is delivered to this number while the app is in demo mode
+DEMO_PHONE_NUMBER = os.environ.get("TWILIO_DEMO_PHONE_NUMBER", "+919877235405")
 
-async def send_order_confirmation_sms(phone_number: str, final_cost: float, vendor_name: str):
-    """Sends order confirmation SMS to vendors."""
-    demo_phone_number = "+919877235405"
-    
-    if not twilio_client:
-        print("--- TWILIO NOT CONFIGURED - MOCK SMS ---")
-        print(f"TO: {demo_phone_number} (Demo override - original: {phone_number})")
-        print(f"MESSAGE: Confirmation for {vendor_name}, cost ₹{final_cost:.2f}")
-        print("--------------------------------------")
-        return False
-
-    message_body = (
+# --- Async delivery: Twilio calls run off the event loop, throttled by the dispatcher ---
+if twilio_client:
+    sms_transport = TwilioTransport(twilio_client, TWILIO_PHONE_NUMBER, override_to=DEMO_PHONE_NUMBER)
+else:
+    sms_transport = ConsoleTransport()
+
+# SMS_CONCURRENCY caps the sends in flight; SMS_WORKERS (the old worker-pool size) is still read as a fallback
+SMS_CONCURRENCY = int(os.environ.get("SMS_CONCURRENCY", os.environ.get("SMS_WORKERS", "4")))
+
+sms_dispatcher = NotificationDispatcher(
+    sms_transport,
+    concurrency=SMS_CONCURRENCY,
+    rate_per_second=float(os.environ.get("SMS_RATE_PER_SECOND", "10"))
+)
+
+
+def build_order_confirmation_message(final_cost: float, vendor_name: str) -> str:
+    return (
         f"ਸਤਿ ਸ੍ਰੀ ਅਕਾਲ {vendor_name}, Vendor Collective 'ਤੇ ਤੁਹਾਡਾ ਆਰਡਰ ਫਾਈਨਲ ਹੋ ਗਿਆ ਹੈ। "
         f"ਤੁਹਾਡੇ ਵਾਲਿਟ ਤੋਂ ₹{final_cost:.2f} ਕੱਟੇ ਗਏ ਹਨ। ਤੁਹਾਡੀ ਡਿਲੀਵਰੀ ਕੱਲ੍ਹ ਆ ਜਾਵੇਗੀ।"
     )
 
-    try:
-        message = twilio_client.messages.create(to=demo_phone_number, from_=TWILIO_PHONE_NUMBER, body=message_body)
-        logger.info(f"SMS sent successfully to {demo_phone_number}. SID: {message.sid}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send SMS: {e}")
-        return False
 
-
-async def send_supplier_notification_sms(phone_number: str, total_orders: int, products_summary: str, supplier_name: str):
-    """Notify suppliers about new orders."""
-    demo_phone_number = "+919877235405"
-    
-    if not twilio_client:
-        print("--- MOCK SMS - SUPPLIER NOTIFICATION ---")
-        print(f"TO: {demo_phone_number} (Supplier: {supplier_name})")
-        print(f"MESSAGE: New orders received - {total_orders} orders")
-        return False
-
-    message_body = (
+def build_supplier_notification_message(total_orders: int, products_summary: str, supplier_name: str) -> str:
+    return (
         f"ਸਤਿ ਸ੍ਰੀ ਅਕਾਲ {supplier_name}, Vendor Collective 'ਤੇ ਤੁਹਾਨੂੰ {total_orders} ਨਵੇ ਆਰਡਰ ਮਿਲੇ ਹਨ। "
         f"ਉਤਪਾਦ: {products_summary}। ਕਿਰਪਾ ਕਰਕੇ ਆਰਡਰ ਤਿਆਰ ਕਰੋ।"
     )
 
-    try:
-        message = twilio_client.messages.create(to=demo_phone_number, from_=TWILIO_PHONE_NUMBER, body=message_body)
-        logger.info(f"Supplier SMS sent successfully. SID: {message.sid}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send supplier SMS: {e}")
-        return False
-
-
-async def send_agent_notification_sms(phone_number: str, message_type: str, details: str, agent_name: str):
-    """Send notifications to delivery agents."""
-    demo_phone_number = "+919877235405"
-    
-    if not twilio_client:
-        print("--- MOCK SMS - AGENT NOTIFICATION ---")
-        print(f"TO: {demo_phone_number} (Agent: {agent_name})")
-        print(f"MESSAGE: {message_type} - {details}")
-        return False
 
+def build_agent_notification_message(message_type: str, details: str, agent_name: str) -> str:
     message_templates = {
         'route_assigned': f"ਸਤਿ ਸ੍ਰੀ ਅਕਾਲ {agent_name}, ਅੱਜ ਤੁਹਾਨੂੰ ਰੂਟ ਮਿਲ ਗਿਆ ਹੈ। {details}",
         'pickup_ready': f"ਸਤਿ ਸ੍ਰੀ ਅਕਾਲ {agent_name}, {details} ਤੋਂ ਪਿਕਅਪ ਤਿਆਰ ਹੈ।",
         'route_completed': f"ਸ਼ਾਬਾਸ਼ {agent_name}! ਅੱਜ ਦਾ ਰੂਟ ਪੂਰਾ ਹੋ ਗਿਆ। {details}"
     }
+    return message_templates.get(message_type, f"ਅੱਪਡੇਟ: {details}")
 
-    message_body = message_templates.get(message_type, f"ਅੱਪਡੇਟ: {details}")
-
-    try:
-        message = twilio_client.messages.create(to=demo_phone_number, from_=TWILIO_PHONE_NUMBER, body=message_body)
-        logger.info(f"Agent SMS sent successfully. SID: {message.sid}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send agent SMS: {e}")
-        return False
-
-
-async def send_vendor_delivery_update_sms(phone_number: str, message_type: str, details: str, vendor_name: str):
-    """Send delivery status updates to vendors."""
-    demo_phone_number = "+919877235405"
-    
-    if not twilio_client:
-        print("--- MOCK SMS - VENDOR DELIVERY UPDATE ---")
-        print(f"TO: {demo_phone_number} (Vendor: {vendor_name})")
-        print(f"MESSAGE: {message_type} - {details}")
-        return False
 
+def build_vendor_delivery_update_message(message_type: str, details: str, vendor_name: str) -> str:
     message_templates = {
         'agent_started': f"ਸਤਿ ਸ੍ਰੀ ਅਕਾਲ {vendor_name}, ਏਜੰਟ ਨੇ ਰੂਟ ਸ਼ੁਰੂ ਕੀਤਾ ਹੈ। {details}",
         'out_for_delivery': f"ਸਤਿ ਸ੍ਰੀ ਅਕਾਲ {vendor_name}, ਤੁਹਾਡਾ ਆਰਡਰ ਡਿਲੀਵਰੀ ਲਈ ਰਵਾਨਾ ਹੋ ਗਿਆ ਹੈ। {details}",
         'delivered': f"ਸਤਿ ਸ੍ਰੀ ਅਕਾਲ {vendor_name}, ਤੁਹਾਡਾ ਆਰਡਰ ਪਹੁੰਚ ਗਿਆ ਹੈ। ਕਿਰਪਾ ਕਰਕੇ ਪੁਸ਼ਟੀ ਕਰੋ।"
     }
+    return message_templates.get(message_type, f"ਅੱਪਡੇਟ: {details}")
+
+
+def build_admin_alert_message(alert_type: str, details: str) -> str:
+    return f"🚨 Vendor Collective Alert: {alert_type}\nDetails: {details}\nCheck admin dashboard."
+
 
-    message_body = message_templates.get(message_type, f"ਅੱਪਡੇਟ: {details}")
+# --- Awaitable senders: deliver now (without blocking the event loop) and report success ---
 
-    try:
-        message = twilio_client.messages.create(to=demo_phone_number, from_=TWILIO_PHONE_NUMBER, body=message_body)
-        logger.info(f"Vendor delivery SMS sent successfully. SID: {message.sid}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send vendor delivery SMS: {e}")
-        return False
+async def send_order_confirmation_sms(phone_number: str, final_cost: float, vendor_name: str):
+    """Sends order confirmation SMS to vendors."""
+    return await sms_dispatcher.transport.send(phone_number, build_order_confirmation_message(final_cost, vendor_name))
+
+
+async def send_supplier_notification_sms(phone_number: str, total_orders: int, products_summary: str, supplier_name: str):
+    """Notify suppliers about new orders."""
+    return await sms_dispatcher.transport.send(phone_number, build_supplier_notification_message(total_orders, products_summary, supplier_name))
+
+
+async def send_agent_notification_sms(phone_number: str, message_type: str, details: str, agent_name: str):
+    """Send notifications to delivery agents."""
+    return await sms_dispatcher.transport.send(phone_number, build_agent_notification_message(message_type, details, agent_name))
+
+
+async def send_vendor_delivery_update_sms(phone_number: str, message_type: str, details: str, vendor_name: str):
+    """Send delivery status updates to vendors."""
+    return await sms_dispatcher.transport.send(phone_number, build_vendor_delivery_update_message(message_type, details, vendor_name))
 
 
 async def send_admin_alert_sms(phone_number: str, alert_type: str, details: str):
     """Send system alerts to admin."""
-    demo_phone_number = "+919877235405"
-    
-    if not twilio_client:
-        print("--- MOCK SMS - ADMIN ALERT ---")
-        print(f"TO: {demo_phone_number} (Admin)")
-        print(f"MESSAGE: {alert_type} - {details}")
-        return False
-
-    message_body = f"🚨 Vendor Collective Alert: {alert_type}\nDetails: {details}\nCheck admin dashboard."
-
-    try:
-        message = twilio_client.messages.create(to=demo_phone_number, from_=TWILIO_PHONE_NUMBER, body=message_body)
-        logger.info(f"Admin alert SMS sent successfully. SID: {message.sid}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send admin alert SMS: {e}")
-        return False
\ No newline at end of file
+    return await sms_dispatcher.transport.send(phone_number, build_admin_alert_message(alert_type, details))
+
+
+# --- Durable delivery: write to the outbox inside the caller's transaction ---
+
+async def enqueue_sms(db: AsyncSession, messages: List[Tuple[str, str]]):
+    """
+    Add (phone_number, body) messages to the notification outbox.
+
+    Nothing is sent here and nothing is committed: the rows become visible to
+    utils/outbox_worker.py only if the caller's transaction commits, so a
+    notification exists exactly when the change it announces does.
+    """
+    if not messages:
+        return
+    await db.execute(
+        insert(NotificationOutbox),
+        [{"id": uuid.uuid4(), "recipient": to, "body": body} for to, body in messages]
+    )
+
+
+def order_confirmation_sms(phone_number: str, final_cost: float, vendor_name: str) -> Tuple[str, str]:
+    """Build the outbox entry for an order confirmation."""
+    return phone_number, build_order_confirmation_message(final_cost, vendor_name)
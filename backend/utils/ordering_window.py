@@ -0,0 +1,109 @@
+# ==============================================================================
+# File: utils/ordering_window.py (Ordering Window Gate)
+# ==============================================================================
+# Pure ASGI middleware that rejects cart and product changes outside the
+# collective's daily ordering window. Reads (GET/HEAD/OPTIONS) and every other
+# route pass straight through. The window is configured with
+# ORDERING_WINDOW_OPEN / ORDERING_WINDOW_CLOSE (local HH:MM, default 18:00-23:30)
+# and ORDERING_WINDOW_TZ (default Asia/Kolkata); a close earlier than the open
+# means the window runs past midnight.
+#
+# The window boundaries are worked out in the configured time zone once per
+# local day and kept as monotonic-clock deadlines, so a gated request only
+# compares two floats.
+import json
+import os
+import time
+from datetime import datetime, time as dt_time, timedelta
+from typing import List, Sequence, Tuple
+
+import pytz
+
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+GATED_PREFIXES = ("/cart/items", "/products")
+
+
+def _parse_clock(value: str) -> dt_time:
+    hour, minute = value.split(":")
+    return dt_time(int(hour), int(minute))
+
+
+def _format_clock(clock: dt_time) -> str:
+    return clock.strftime("%I:%M %p").lstrip("0")
+
+
+class OrderingSchedule:
+    """Daily open/close window in a time zone, checked against the monotonic clock."""
+
+    def __init__(self, open_at: dt_time, close_at: dt_time, tz_name: str):
+        self.open_at = open_at
+        self.close_at = close_at
+        self.tz = pytz.timezone(tz_name)
+        self._windows: List[Tuple[float, float]] = []
+        self._refresh_at = float("-inf")
+
+    @classmethod
+    def from_env(cls) -> "OrderingSchedule":
+        return cls(
+            _parse_clock(os.environ.get("ORDERING_WINDOW_OPEN", "18:00")),
+            _parse_clock(os.environ.get("ORDERING_WINDOW_CLOSE", "23:30")),
+            os.environ.get("ORDERING_WINDOW_TZ", "Asia/Kolkata")
+        )
+
+    def _local(self, day, clock: dt_time) -> datetime:
+        return self.tz.normalize(self.tz.localize(datetime.combine(day, clock)))
+
+    def _refresh(self):
+        """Recompute the windows that touch the current local day (DST-safe), as monotonic deadlines."""
+        offset = time.time() - time.monotonic()
+        today = datetime.now(self.tz).date()
+
+        windows = []
+        # Yesterday's window may run past midnight into today
+        for day in (today - timedelta(days=1), today):
+            opens = self._local(day, self.open_at)
+            close_day = day + timedelta(days=1) if self.close_at <= self.open_at else day
+            closes = self._local(close_day, self.close_at)
+            windows.append((opens.timestamp() - offset, closes.timestamp() - offset))
+
+        self._windows = windows
+        self._refresh_at = self._local(today + timedelta(days=1), dt_time(0, 0)).timestamp() - offset
+
+    def is_open(self) -> bool:
+        now = time.monotonic()
+        if now >= self._refresh_at:
+            self._refresh()
+        return any(opens <= now < closes for opens, closes in self._windows)
+
+    def describe(self) -> str:
+        zone = datetime.now(self.tz).strftime("%Z")
+        return f"It is open from {_format_clock(self.open_at)} to {_format_clock(self.close_at)} {zone}."
+
+
+class OrderingWindowGate:
+    """Return 403 for mutating requests on gated paths while the ordering window is closed."""
+
+    def __init__(self, app, schedule: OrderingSchedule = None, prefixes: Sequence[str] = GATED_PREFIXES):
+        self.app = app
+        self.schedule = schedule or OrderingSchedule.from_env()
+        self.prefixes = tuple(prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] in SAFE_METHODS
+            or not scope["path"].startswith(self.prefixes)
+            or self.schedule.is_open()
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        body = json.dumps({
+            "detail": f"The ordering window is currently closed. {self.schedule.describe()}"
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 403,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,142 @@
+# ==============================================================================
+# File: utils/outbox_worker.py (Notification Outbox Worker)
+# ==============================================================================
+# Drains the notification_outbox table. A batch is claimed by leasing its rows
+# (available_at pushed OUTBOX_LEASE ahead, picked with FOR UPDATE SKIP LOCKED) in
+# a short transaction, so any number of workers (the in-app task started from
+# main.py, or standalone `python -m utils.outbox_worker` processes) can run side
+# by side without sending a message twice. Messages are sent with no transaction
+# or pooled connection held; outcomes are written in a second short transaction.
+# A worker that dies mid-batch leaves its rows to be claimed again once the
+# lease runs out.
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from typing import List, Optional
+from sqlalchemy import select, update, func, case, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import AsyncSessionLocal
+from models import NotificationOutbox
+from utils.notifications import sms_dispatcher
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL_SECONDS", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_BASE = timedelta(seconds=30)  # Doubles after every failed attempt
+# A claimed row is not claimed again before this; must exceed the time a batch takes to send
+OUTBOX_LEASE = timedelta(seconds=int(os.environ.get("OUTBOX_LEASE_SECONDS", "300")))
+
+
+async def _deliver(row) -> bool:
+    try:
+        return await sms_dispatcher.send(row.recipient, row.body)
+    except Exception as e:
+        logger.error(f"Outbox message {row.id} failed: {e}")
+        return False
+
+
+async def claim_outbox_batch(db: AsyncSession, batch_size: int = OUTBOX_BATCH_SIZE) -> List:
+    """
+    Lease one batch of due messages and commit, counting the attempt up front.
+
+    Returns:
+        list: (id, recipient, body) rows of the claimed messages
+    """
+    due = select(NotificationOutbox.id).where(
+        NotificationOutbox.status == 'pending',
+        NotificationOutbox.available_at <= func.now()
+    ).order_by(NotificationOutbox.available_at).limit(batch_size).with_for_update(skip_locked=True)
+
+    result = await db.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id.in_(due.scalar_subquery()))
+        .values(available_at=func.now() + OUTBOX_LEASE, attempts=NotificationOutbox.attempts + 1)
+        .returning(NotificationOutbox.id, NotificationOutbox.recipient, NotificationOutbox.body)
+        .execution_options(synchronize_session=False)
+    )
+    rows = list(result.all())
+    await db.commit()
+    return rows
+
+
+async def record_outbox_results(db: AsyncSession, sent_ids: List, failed_ids: List):
+    """Mark sent messages, and schedule a retry (or give up) for the failed ones."""
+    if sent_ids:
+        await db.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(sent_ids))
+            .values(status='sent', sent_at=func.now(), last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+    if failed_ids:
+        exhausted = NotificationOutbox.attempts >= OUTBOX_MAX_ATTEMPTS
+        await db.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(failed_ids))
+            .values(
+                status=case((exhausted, 'failed'), else_='pending'),
+                last_error=case(
+                    (exhausted, "Transport reported failure; giving up"),
+                    else_="Transport reported failure"
+                ),
+                available_at=func.now() + literal(OUTBOX_RETRY_BASE) * func.power(2, NotificationOutbox.attempts - 1)
+            )
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+
+
+async def process_outbox_batch(db: AsyncSession, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Claim one batch of due messages, send them concurrently and record the outcome.
+
+    No transaction is open while the messages are being sent, so a slow
+    transport never holds a pooled connection.
+
+    Returns:
+        int: Number of messages claimed
+    """
+    rows = await claim_outbox_batch(db, batch_size)
+    if not rows:
+        return 0
+
+    results = await asyncio.gather(*(_deliver(row) for row in rows))
+
+    await record_outbox_results(
+        db,
+        [row.id for row, delivered in zip(rows, results) if delivered],
+        [row.id for row, delivered in zip(rows, results) if not delivered]
+    )
+    return len(rows)
+
+
+async def run_outbox_worker(stop_event: Optional[asyncio.Event] = None):
+    """Poll the outbox until stop_event is set; back off while the outbox is empty."""
+    logger.info("Notification outbox worker started")
+    while stop_event is None or not stop_event.is_set():
+        try:
+            async with AsyncSessionLocal() as db:
+                claimed = await process_outbox_batch(db)
+        except Exception as e:
+            logger.error(f"Outbox worker error: {e}")
+            claimed = 0
+
+        if claimed == 0:
+            # Sleep, but wake up immediately on shutdown
+            try:
+                if stop_event is None:
+                    await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+                else:
+                    await asyncio.wait_for(stop_event.wait(), OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    logger.info("Notification outbox worker stopped")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_outbox_worker())
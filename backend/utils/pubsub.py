@@ -0,0 +1,75 @@
+# ==============================================================================
+# File: utils/pubsub.py (In-Process Publish/Subscribe)
+# ==============================================================================
+# Topic-based fan-out for push endpoints. Each subscriber owns a bounded queue:
+# a publisher never waits on a slow client. When a queue is full, its oldest
+# event is dropped to make room and the subscriber is flagged, so the consumer
+# can tell the client it missed events. Subscriptions live in this process;
+# events published by other workers are not seen.
+import asyncio
+import os
+from typing import Any, Dict, Hashable, Iterable, Set
+
+PUBSUB_QUEUE_SIZE = int(os.environ.get("PUBSUB_QUEUE_SIZE", "100"))
+
+
+class Subscription:
+    """A consumer's view of the topics it follows; use as a context manager."""
+
+    def __init__(self, hub: "PubSub", topics: Iterable[Hashable], max_queue: int):
+        self._hub = hub
+        self.topics = frozenset(topics)
+        self.queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0  # Events discarded because the consumer fell behind
+
+    def offer(self, event: Any):
+        """Enqueue without blocking, evicting the oldest event if the queue is full."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self) -> Any:
+        return await self.queue.get()
+
+    def close(self):
+        self._hub._unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PubSub:
+    """Registry of subscriptions by topic."""
+
+    def __init__(self, max_queue: int = PUBSUB_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self._subscribers: Dict[Hashable, Set[Subscription]] = {}
+
+    def subscribe(self, topics: Iterable[Hashable]) -> Subscription:
+        subscription = Subscription(self, topics, self.max_queue)
+        for topic in subscription.topics:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def has_subscribers(self, topic: Hashable) -> bool:
+        """Cheap check so publishers can skip building events nobody will receive."""
+        return topic in self._subscribers
+
+    def publish(self, topic: Hashable, event: Any) -> int:
+        """Deliver an event to every subscriber of `topic`; returns how many received it."""
+        subscribers = self._subscribers.get(topic, ())
+        for subscription in subscribers:
+            subscription.offer(event)
+        return len(subscribers)
@@ -0,0 +1,359 @@
+# ==============================================================================
+# File: utils/route_optimizer.py (Delivery Stop Sequencing)
+# ==============================================================================
+# Orders the stops of a delivery route to keep the agent's driving distance low.
+#
+#   1. Distance matrix: great-circle (haversine) distances between all stops,
+#      computed in one vectorized NumPy pass.
+#   2. Construction: nearest neighbour, only ever choosing a stop whose
+#      prerequisites (e.g. the pickups a delivery needs) are already visited.
+#   3. Improvement: 2-opt segment reversals and Or-opt segment moves, rejecting
+#      any move that would break a prerequisite, until no move helps or the
+#      time budget runs out.
+#
+# The route is an open path: it starts at the agent's location when known
+# (anywhere otherwise) and ends at the last stop.
+#
+# With several agents, partition_stops() first splits the deliveries into one
+# geographic cluster per agent (capacitated k-means on the manifest quantities)
+# and gives every cluster the pickups its deliveries depend on.
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+ROUTE_OPTIMIZER_TIME_BUDGET = float(os.environ.get("ROUTE_OPTIMIZER_TIME_BUDGET_SECONDS", "2.0"))
+# Each agent may carry up to this factor above an even share of the night's load
+ROUTE_CAPACITY_SLACK = float(os.environ.get("ROUTE_CAPACITY_SLACK", "1.15"))
+_KMEANS_ITERATIONS = 25
+_EPSILON = 1e-9
+
+
+@dataclass
+class StopInput:
+    """A stop to sequence. `depends_on` lists the keys of stops that must be visited first."""
+    key: Hashable
+    stop_type: str  # 'pickup' or 'delivery'
+    lat: Optional[float]
+    lng: Optional[float]
+    depends_on: Tuple[Hashable, ...] = ()
+
+
+def haversine_matrix(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """Pairwise great-circle distances in km between points given in degrees."""
+    lat = np.radians(lat)
+    lng = np.radians(lng)
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _stop_coordinates(stops: Sequence[StopInput]) -> np.ndarray:
+    """(lat, lng) array for the stops; missing locations are replaced by the centroid of the known ones."""
+    coords = np.array(
+        [[np.nan if s.lat is None else s.lat, np.nan if s.lng is None else s.lng] for s in stops],
+        dtype=float
+    ).reshape(-1, 2)
+    known = ~np.isnan(coords).any(axis=1)
+    coords[~known] = coords[known].mean(axis=0) if known.any() else 0.0
+    return coords
+
+
+def _positions(seq: np.ndarray) -> np.ndarray:
+    pos = np.empty(len(seq), dtype=np.int64)
+    pos[seq] = np.arange(len(seq))
+    return pos
+
+
+def _is_feasible(seq: np.ndarray, before: np.ndarray, after: np.ndarray) -> bool:
+    pos = _positions(seq)
+    return bool(np.all(pos[before] < pos[after]))
+
+
+def path_length(seq: Sequence[int], dist: np.ndarray) -> float:
+    seq = np.asarray(seq)
+    return float(dist[seq[:-1], seq[1:]].sum())
+
+
+def _nearest_neighbour(dist: np.ndarray, prec: np.ndarray, first: Optional[int]) -> np.ndarray:
+    size = len(dist)
+    end = size - 1
+    pending = prec.sum(axis=0)  # Number of unvisited prerequisites per node
+    visited = np.zeros(size, dtype=bool)
+    visited[0] = visited[end] = True
+
+    seq = [0]
+    current = 0
+    for step in range(size - 2):
+        eligible = ~visited & (pending == 0)
+        if not eligible.any():
+            # Only reachable with cyclic prerequisites: fall back to ignoring them
+            logger.warning("Route prerequisites contain a cycle; ignoring them for the remaining stops")
+            eligible = ~visited
+
+        if step == 0 and first is not None and eligible[first]:
+            nxt = first
+        else:
+            nxt = int(np.argmin(np.where(eligible, dist[current], np.inf)))
+
+        seq.append(nxt)
+        visited[nxt] = True
+        pending[prec[nxt]] -= 1
+        current = nxt
+
+    seq.append(end)
+    return np.array(seq, dtype=np.int64)
+
+
+def _two_opt_pass(seq, dist, before, after, deadline) -> bool:
+    """Apply improving segment reversals. Returns True if the route changed."""
+    n = len(seq) - 2
+    improved = False
+    pos = _positions(seq)
+    for i in range(1, n):
+        if time.monotonic() > deadline:
+            break
+        a, b = seq[i - 1], seq[i]
+        js = np.arange(i + 1, n + 1)
+        c, d = seq[js], seq[js + 1]
+        delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+
+        for k in np.argsort(delta)[:8]:
+            if delta[k] >= -_EPSILON:
+                break
+            j = js[k]
+            # Reversing seq[i..j] breaks a prerequisite iff both ends of it lie inside the segment
+            inside = (pos[before] >= i) & (pos[before] <= j) & (pos[after] >= i) & (pos[after] <= j)
+            if inside.any():
+                continue
+            seq[i:j + 1] = seq[i:j + 1][::-1]
+            pos = _positions(seq)
+            improved = True
+            break
+    return improved
+
+
+def _or_opt_pass(seq, dist, before, after, deadline) -> bool:
+    """Move short segments (1-3 stops) to a cheaper place. Returns True if the route changed."""
+    improved = False
+    for length in (1, 2, 3):
+        i = 1
+        while i + length <= len(seq) - 1:
+            if time.monotonic() > deadline:
+                return improved
+            segment = seq[i:i + length]
+            s0, s1 = segment[0], segment[-1]
+            p, q = seq[i - 1], seq[i + length]
+            gain = dist[p, s0] + dist[s1, q] - dist[p, q]
+
+            rest = np.concatenate([seq[:i], seq[i + length:]])
+            left, right = rest[:-1], rest[1:]
+            delta = dist[left, s0] + dist[s1, right] - dist[left, right] - gain
+            delta[i - 1] = np.inf  # Re-inserting where it came from is not a move
+
+            moved = False
+            for k in np.argsort(delta)[:8]:
+                if delta[k] >= -_EPSILON:
+                    break
+                candidate = np.concatenate([rest[:k + 1], segment, rest[k + 1:]])
+                if _is_feasible(candidate, before, after):
+                    seq[:] = candidate
+                    improved = moved = True
+                    break
+            if not moved:
+                i += 1
+    return improved
+
+
+def optimize_stop_sequence(
+    stops: List[StopInput],
+    start: Optional[Tuple[float, float]] = None,
+    time_budget: float = ROUTE_OPTIMIZER_TIME_BUDGET
+) -> List[StopInput]:
+    """
+    Order stops to minimise driving distance while honouring prerequisites.
+
+    Args:
+        stops: Stops to visit. Stops without coordinates are placed as if at
+            the centroid of the others.
+        start: (lat, lng) the agent starts from, if known
+        time_budget: Seconds the improvement phase may use
+
+    Returns:
+        List[StopInput]: The same stops in visiting order
+    """
+    n = len(stops)
+    if n <= 1:
+        return list(stops)
+
+    deadline = time.monotonic() + time_budget
+
+    coords = _stop_coordinates(stops)
+
+    # Node 0 is the start, nodes 1..n the stops, node n+1 a free "end anywhere" sentinel
+    dist = np.zeros((n + 2, n + 2))
+    dist[1:n + 1, 1:n + 1] = haversine_matrix(coords[:, 0], coords[:, 1])
+    first = None
+    if start is not None:
+        from_start = haversine_matrix(
+            np.concatenate([[start[0]], coords[:, 0]]),
+            np.concatenate([[start[1]], coords[:, 1]])
+        )[0, 1:]
+        dist[0, 1:n + 1] = dist[1:n + 1, 0] = from_start
+    else:
+        # No depot: start at an extreme stop rather than in the middle of the cluster
+        centroid = coords.mean(axis=0)
+        spread = haversine_matrix(
+            np.concatenate([[centroid[0]], coords[:, 0]]),
+            np.concatenate([[centroid[1]], coords[:, 1]])
+        )[0, 1:]
+        first = int(np.argmax(spread)) + 1
+
+    node_of = {stop.key: i for i, stop in enumerate(stops, start=1)}
+    prec = np.zeros((n + 2, n + 2), dtype=bool)  # prec[u, v]: u must be visited before v
+    for v, stop in enumerate(stops, start=1):
+        for key in stop.depends_on:
+            u = node_of.get(key)
+            if u is not None and u != v:
+                prec[u, v] = True
+    before, after = np.nonzero(prec)
+
+    if first is not None and prec[:, first].any():
+        first = None  # The extreme stop has prerequisites; let nearest neighbour pick
+
+    seq = _nearest_neighbour(dist, prec, first)
+    initial_length = path_length(seq, dist)
+
+    if _is_feasible(seq, before, after):
+        while time.monotonic() < deadline:
+            changed = _two_opt_pass(seq, dist, before, after, deadline)
+            changed = _or_opt_pass(seq, dist, before, after, deadline) or changed
+            if not changed:
+                break
+
+    logger.info(
+        f"Sequenced {n} stops: {initial_length:.1f} km after construction, "
+        f"{path_length(seq, dist):.1f} km after improvement"
+    )
+    return [stops[node - 1] for node in seq[1:-1]]
+
+
+# --- Multi-agent partitioning ---
+
+def _kmeans_plus_plus(coords: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    centers = [coords[rng.integers(len(coords))]]
+    for _ in range(1, k):
+        nearest = haversine_matrix(
+            np.concatenate([np.array(centers)[:, 0], coords[:, 0]]),
+            np.concatenate([np.array(centers)[:, 1], coords[:, 1]])
+        )[:len(centers), len(centers):].min(axis=0)
+        weights = nearest ** 2
+        total = weights.sum()
+        index = rng.choice(len(coords), p=weights / total) if total > 0 else rng.integers(len(coords))
+        centers.append(coords[index])
+    return np.array(centers)
+
+
+def _distances_to(coords: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """(len(coords), len(centers)) haversine distances."""
+    k = len(centers)
+    both = np.concatenate([centers, coords])
+    return haversine_matrix(both[:, 0], both[:, 1])[k:, :k]
+
+
+def _capacitated_assignment(dist: np.ndarray, loads: np.ndarray, capacity: float) -> np.ndarray:
+    """
+    Assign every point to a cluster with room left, nearest first.
+
+    Points that lose the most by not getting their nearest cluster (largest
+    regret) choose first. A point that fits nowhere goes to the emptiest cluster.
+    """
+    n, k = dist.shape
+    remaining = np.full(k, capacity, dtype=float)
+    assignment = np.empty(n, dtype=np.int64)
+
+    ranked = np.sort(dist, axis=1)
+    regret = ranked[:, 1] - ranked[:, 0] if k > 1 else np.zeros(n)
+    for point in np.argsort(-regret, kind="stable"):
+        for cluster in np.argsort(dist[point]):
+            if remaining[cluster] >= loads[point]:
+                break
+        else:
+            cluster = int(np.argmax(remaining))
+        assignment[point] = cluster
+        remaining[cluster] -= loads[point]
+    return assignment
+
+
+def partition_stops(
+    stops: List[StopInput],
+    loads: Dict[Hashable, float],
+    agent_starts: List[Optional[Tuple[float, float]]],
+    slack: float = ROUTE_CAPACITY_SLACK,
+    seed: int = 0
+) -> List[List[StopInput]]:
+    """
+    Split stops between agents by geography and load.
+
+    Deliveries are clustered with a capacitated k-means: every agent carries at
+    most `slack` times an even share of the total load. Clusters are seeded at
+    the agents' own locations where known, so cluster i sits near agent i. Each
+    cluster then gets the pickups its deliveries depend on; a supplier serving
+    several clusters is visited by each of those agents.
+
+    Args:
+        stops: Pickup and delivery stops, as built for optimize_stop_sequence
+        loads: Load per delivery key (e.g. total quantity ordered); missing keys count as 1
+        agent_starts: (lat, lng) of each agent, or None when unknown
+        slack: Capacity head-room above an even split
+        seed: Seed for the k-means++ initialisation of unlocated agents
+
+    Returns:
+        List: One stop list per agent, in the order of agent_starts (possibly empty)
+    """
+    deliveries = [stop for stop in stops if stop.stop_type == 'delivery']
+    partitions: List[List[StopInput]] = [[] for _ in agent_starts]
+    if not deliveries or not agent_starts:
+        return partitions
+
+    k = min(len(agent_starts), len(deliveries))
+    coords = _stop_coordinates(deliveries)
+    weights = np.array([float(loads.get(stop.key, 1)) for stop in deliveries])
+    capacity = weights.sum() / k * slack
+
+    # Seed with the first k agents' locations, k-means++ for the rest
+    rng = np.random.default_rng(seed)
+    centers = _kmeans_plus_plus(coords, k, rng)
+    for cluster, start in enumerate(agent_starts[:k]):
+        if start is not None:
+            centers[cluster] = start
+
+    assignment = None
+    for _ in range(_KMEANS_ITERATIONS):
+        new_assignment = _capacitated_assignment(_distances_to(coords, centers), weights, capacity)
+        if assignment is not None and np.array_equal(new_assignment, assignment):
+            break
+        assignment = new_assignment
+        for cluster in range(k):
+            members = assignment == cluster
+            if members.any():
+                centers[cluster] = coords[members].mean(axis=0)
+
+    pickups = {stop.key: stop for stop in stops if stop.stop_type == 'pickup'}
+    for cluster in range(k):
+        cluster_deliveries = [deliveries[i] for i in np.flatnonzero(assignment == cluster)]
+        needed = dict.fromkeys(key for stop in cluster_deliveries for key in stop.depends_on if key in pickups)
+        partitions[cluster] = [pickups[key] for key in needed] + cluster_deliveries
+
+    logger.info(
+        f"Partitioned {len(deliveries)} deliveries across {k} agents "
+        f"(capacity {capacity:.0f}, loads {[round(float(weights[assignment == c].sum())) for c in range(k)]})"
+    )
+    return partitions